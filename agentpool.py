@@ -0,0 +1,305 @@
+import atexit
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import duediligenceprompt as prompt
+import tracing
+
+load_dotenv()
+
+AZUREML_CONN_STR = os.getenv("AZUREML_CONN_STR")
+BING_CONNECTION_NAME = os.getenv("BING_CONNECTION_NAME")
+AGENT_MODEL = os.getenv("AGENT_MODEL", "gpt-4o")
+
+# Static instructions per agent role. Anything that changes per request (file
+# ids, previous analysis, report text) is passed per run as additional
+# instructions so the agents themselves can be created once and reused.
+AGENT_SPECS = {
+    "ticker-resolver": {
+        "instructions": (
+            "You are a financial assistant. Given a company name, respond ONLY with the official US stock ticker symbol from NYSE. "
+            "If company_or_ticker name is Microsoft, respond with MSFT. "
+            "If company_or_ticker name is Apple, respond with AAPL. "
+            "Don't include any other information. "
+            "If you cannot find a ticker, respond with 'NOTICKER'."
+        ),
+        "tools": ("bing",),
+    },
+    "pdf-chat-agent": {
+        "instructions": (
+            "You are an expert assistant that answers questions based on the provided PDF content. "
+            "Use the context from the PDF to provide a precise answer."
+        ),
+        "tools": (),
+    },
+    "comprehensive-agent": {
+        "instructions": (
+            "You are a senior financial analyst. "
+            "Perform a comprehensive due diligence for the company, including broad market conditions, cashflows, debt, and liquidity. "
+            "Use Bing and all available market information. "
+            "If information is not available, say so. "
+            "Conclude if due diligence is passed or failed, and explain why. "
+            "Summarize findings in markdown and tabular format. "
+            "Include any charts or tables as needed. "
+            "Mandatorily, conclude if due diligence is passed or failed. "
+        ),
+        "tools": ("bing", "code_interpreter"),
+    },
+    "comprehensive-merge": {
+        "instructions": (
+            "You are a senior financial analyst reviewing the findings of several specialist analyses of one company. "
+            "Combine them into a short overall assessment in markdown with a summary table. "
+            "If a specialist analysis is missing or incomplete, say so and weigh it in your conclusion. "
+            "Mandatorily, conclude if due diligence is passed or failed, and explain why. "
+        ),
+        "tools": (),
+    },
+    "due diligince agent": {
+        "instructions": (
+            prompt.instructions
+            + "Do market research and use the uploaded file to compulsorily provide due diligence report. "
+        ),
+        "tools": ("bing", "code_interpreter"),
+    },
+}
+
+_client_lock = threading.Lock()
+_credential = None
+_project_client = None
+_bing_connection_id = None
+
+
+def get_project_client():
+    global _credential, _project_client
+    if _project_client is None:
+        # The Azure SDK is imported on first use so page views that never
+        # reach an agent do not pay for it.
+        from azure.ai.projects import AIProjectClient
+        from azure.identity import DefaultAzureCredential
+        with _client_lock:
+            if _project_client is None:
+                _credential = DefaultAzureCredential()
+                _project_client = AIProjectClient.from_connection_string(
+                    credential=_credential,
+                    conn_str=AZUREML_CONN_STR
+                )
+    return _project_client
+
+
+def set_project_client(client, bing_connection_id=None):
+    # Swaps the shared client, e.g. for the offline benchmark's stand-in.
+    # Agents created on the previous client are deleted first.
+    global _project_client, _bing_connection_id
+    registry.close()
+    with _client_lock:
+        _project_client = client
+        _bing_connection_id = bing_connection_id
+
+
+def get_bing_connection_id():
+    global _bing_connection_id
+    if _bing_connection_id is None:
+        with tracing.span("connection_lookup"):
+            bing_connection = get_project_client().connections.get(connection_name=BING_CONNECTION_NAME)
+        _bing_connection_id = bing_connection.id
+    return _bing_connection_id
+
+
+def build_toolset(tools):
+    from azure.ai.projects.models import BingGroundingTool, CodeInterpreterTool, ToolSet
+    toolset = ToolSet()
+    if "bing" in tools:
+        toolset.add(BingGroundingTool(connection_id=get_bing_connection_id()))
+    if "code_interpreter" in tools:
+        toolset.add(CodeInterpreterTool())
+    return toolset
+
+
+class AgentRegistry:
+    # Agents are created lazily on first use, keyed by (role, tools), and
+    # deleted once when the process shuts down.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents = {}
+
+    def get(self, role):
+        spec = AGENT_SPECS[role]
+        key = (role, spec["tools"])
+        agent_id = self._agents.get(key)
+        if agent_id is None:
+            with self._lock:
+                agent_id = self._agents.get(key)
+                if agent_id is None:
+                    with tracing.span("agent.create", role=role):
+                        agent = get_project_client().agents.create_agent(
+                            model=AGENT_MODEL,
+                            name=role,
+                            instructions=spec["instructions"],
+                            toolset=build_toolset(spec["tools"])
+                        )
+                    agent_id = agent.id
+                    self._agents[key] = agent_id
+        return agent_id
+
+    def close(self):
+        with self._lock:
+            agent_ids = list(self._agents.values())
+            self._agents = {}
+        if not agent_ids or _project_client is None:
+            return
+        for agent_id in agent_ids:
+            try:
+                _project_client.agents.delete_agent(agent_id)
+            except Exception:
+                pass
+
+
+registry = AgentRegistry()
+atexit.register(registry.close)
+
+
+def code_interpreter_attachment(file_id):
+    from azure.ai.projects.models import CodeInterpreterTool, MessageAttachment
+    return MessageAttachment(file_id=file_id, tools=CodeInterpreterTool().definitions)
+
+
+def _run_with_deadline(project_client, thread_id, agent_id, instructions, additional_instructions, timeout):
+    run = project_client.agents.create_run(
+        thread_id=thread_id,
+        agent_id=agent_id,
+        instructions=instructions,
+        additional_instructions=additional_instructions
+    )
+    deadline = time.monotonic() + timeout
+    while run.status in ("queued", "in_progress", "requires_action", "cancelling"):
+        if time.monotonic() >= deadline:
+            try:
+                project_client.agents.cancel_run(thread_id=thread_id, run_id=run.id)
+            except Exception:
+                pass
+            raise TimeoutError(f"Agent run did not finish within {timeout:.0f}s")
+        time.sleep(1)
+        run = project_client.agents.get_run(thread_id=thread_id, run_id=run.id)
+    return run
+
+
+def run_agent(role, content, file_ids=None, additional_instructions=None, instructions=None, thread_id=None, timeout=None):
+    # Runs the shared agent for a role on a thread and returns (thread_id, messages).
+    # A new thread is created unless one is passed in; the caller owns it.
+    # With a timeout the run is cancelled and TimeoutError raised once it expires.
+    with tracing.span("agent.run", role=role):
+        return _run_agent(role, content, file_ids, additional_instructions, instructions, thread_id, timeout)
+
+
+def _run_agent(role, content, file_ids, additional_instructions, instructions, thread_id, timeout):
+    project_client = get_project_client()
+    agent_id = registry.get(role)
+    owns_thread = thread_id is None
+    if owns_thread:
+        with tracing.span("agent.create_thread"):
+            thread_id = project_client.agents.create_thread().id
+    try:
+        attachments = [code_interpreter_attachment(file_id) for file_id in file_ids] if file_ids else None
+        with tracing.span("agent.create_message", bytes_sent=tracing.text_bytes(content)):
+            project_client.agents.create_message(
+                thread_id=thread_id,
+                role="user",
+                content=content,
+                attachments=attachments,
+            )
+        with tracing.span("agent.process_run", bytes_sent=tracing.text_bytes(instructions, additional_instructions)):
+            if timeout is None:
+                run = project_client.agents.create_and_process_run(
+                    thread_id=thread_id,
+                    agent_id=agent_id,
+                    instructions=instructions,
+                    additional_instructions=additional_instructions
+                )
+            else:
+                run = _run_with_deadline(project_client, thread_id, agent_id, instructions, additional_instructions, timeout)
+            tracing.add_usage(run)
+        with tracing.span("agent.list_messages") as span:
+            messages = project_client.agents.list_messages(thread_id=thread_id)
+            span.add(bytes_received=tracing.text_bytes(*assistant_texts(messages)))
+    except Exception:
+        if owns_thread:
+            delete_thread(thread_id)
+        raise
+    return thread_id, messages
+
+
+def stream_agent(role, content, file_ids=None, additional_instructions=None, instructions=None, thread_id=None):
+    # Streaming counterpart of run_agent. Yields ("thread", thread_id) first,
+    # then ("text", delta), ("image", file_id) and ("message_done", message_id)
+    # as run events arrive. The caller owns (and deletes) the thread.
+    from azure.ai.projects.models import AgentStreamEvent, MessageDeltaChunk, ThreadMessage, ThreadRun
+    project_client = get_project_client()
+    agent_id = registry.get(role)
+    if thread_id is None:
+        thread_id = project_client.agents.create_thread().id
+    yield "thread", thread_id
+    span = tracing.start_span(
+        "agent.stream", role=role, bytes_sent=tracing.text_bytes(content, instructions, additional_instructions)
+    )
+    error = None
+    try:
+        attachments = [code_interpreter_attachment(file_id) for file_id in file_ids] if file_ids else None
+        project_client.agents.create_message(
+            thread_id=thread_id,
+            role="user",
+            content=content,
+            attachments=attachments,
+        )
+        with project_client.agents.create_stream(
+            thread_id=thread_id,
+            agent_id=agent_id,
+            instructions=instructions,
+            additional_instructions=additional_instructions
+        ) as stream:
+            for event_type, event_data, _ in stream:
+                if isinstance(event_data, MessageDeltaChunk):
+                    if event_data.text:
+                        if "first_token" not in span.attrs:
+                            span.add(first_token=round(time.time() - span.start, 3))
+                        span.add(bytes_received=tracing.text_bytes(event_data.text))
+                        yield "text", event_data.text
+                elif isinstance(event_data, ThreadMessage) and event_type == AgentStreamEvent.THREAD_MESSAGE_COMPLETED:
+                    for image_content in event_data.image_contents:
+                        yield "image", image_content.image_file.file_id
+                    yield "message_done", event_data.id
+                elif isinstance(event_data, ThreadRun) and event_data.status in ("failed", "cancelled", "expired"):
+                    raise RuntimeError(f"Agent run {event_data.status}: {event_data.last_error}")
+                elif event_type == AgentStreamEvent.THREAD_RUN_COMPLETED and event_data.usage is not None:
+                    span.add(
+                        prompt_tokens=event_data.usage.prompt_tokens or 0,
+                        completion_tokens=event_data.usage.completion_tokens or 0
+                    )
+                elif event_type == AgentStreamEvent.ERROR:
+                    raise RuntimeError(f"Agent stream error: {event_data}")
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        tracing.end_span(span, error)
+
+
+def delete_thread(thread_id):
+    try:
+        get_project_client().agents.delete_thread(thread_id)
+    except Exception:
+        pass
+
+
+def assistant_texts(messages):
+    texts = []
+    for msg in messages['data']:
+        if msg['role'] == 'assistant':
+            for content in msg['content']:
+                if content['type'] == 'text':
+                    texts.append(content['text']['value'])
+    return texts
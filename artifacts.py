@@ -0,0 +1,151 @@
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from config import CACHE_DIR
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(CACHE_DIR, "artifacts"))
+# Bytes of namespace files kept in memory for reruns, least recently used first out
+ARTIFACT_CACHE_BYTES = int(os.getenv("ARTIFACT_CACHE_BYTES", 256 * 1024 * 1024))
+ARTIFACT_MAX_AGE = float(os.getenv("ARTIFACT_MAX_AGE", 6 * 3600))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+ARTIFACT_REAP_INTERVAL = float(os.getenv("ARTIFACT_REAP_INTERVAL", 300))
+
+
+class ArtifactStore:
+    # Report files (CSV, charts, PDFs) live in one directory per namespace: a
+    # job writes into its own and each UI session links the finished files
+    # into its own, so sessions never overwrite or delete each other's
+    # files. Reads of namespace files are served from a bounded in-memory
+    # cache so reruns do not reopen them. A background reaper removes
+    # namespaces idle for longer than max_age and, beyond max_bytes, the
+    # least recently touched ones.
+    def __init__(self, root=ARTIFACT_DIR, cache_bytes=ARTIFACT_CACHE_BYTES, max_age=ARTIFACT_MAX_AGE,
+                 max_bytes=ARTIFACT_MAX_BYTES, reap_interval=ARTIFACT_REAP_INTERVAL):
+        self.root = root
+        self.cache_bytes = cache_bytes
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.reap_interval = reap_interval
+        self._lock = threading.Lock()
+        self._buffers = OrderedDict()
+        self._buffer_bytes = 0
+        self._reaper = None
+
+    def namespace(self, name):
+        # Returns the namespace directory, created if needed and marked as in
+        # use; sessions call this on every rerun to keep theirs alive.
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        os.utime(path)
+        self._start_reaper()
+        return path
+
+    def adopt(self, name, path):
+        # Hard links path into the namespace (a copy across file systems) and
+        # returns the new path.
+        target_dir = self.namespace(name)
+        target = os.path.join(target_dir, os.path.basename(path))
+        if os.path.abspath(path) == os.path.abspath(target):
+            return target
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+        self._forget(target)
+        return target
+
+    def data(self, path):
+        # File contents as bytes for st.download_button/st.image. Files inside
+        # a namespace are cached for as long as they are unchanged and the
+        # namespace exists; anything else (the chart cache) is read each time.
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cacheable = key.startswith(os.path.abspath(self.root) + os.sep) and stat.st_size <= self.cache_bytes
+        if cacheable:
+            with self._lock:
+                cached = self._buffers.get(key)
+                if cached is not None and cached[0] == version:
+                    self._buffers.move_to_end(key)
+                    return cached[1]
+        with open(key, "rb") as f:
+            content = f.read()
+        if cacheable:
+            with self._lock:
+                self._drop_buffer(key)
+                self._buffers[key] = (version, content)
+                self._buffer_bytes += len(content)
+                while self._buffer_bytes > self.cache_bytes:
+                    self._drop_buffer(next(iter(self._buffers)))
+        return content
+
+    def _drop_buffer(self, key):
+        cached = self._buffers.pop(key, None)
+        if cached is not None:
+            self._buffer_bytes -= len(cached[1])
+
+    def _forget(self, prefix):
+        prefix = os.path.abspath(prefix)
+        with self._lock:
+            for key in [k for k in self._buffers if k == prefix or k.startswith(prefix + os.sep)]:
+                self._drop_buffer(key)
+
+    def release(self, name):
+        # Deletes a namespace right away (the session's "Clear").
+        path = os.path.join(self.root, name)
+        self._forget(path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def usage(self):
+        # [(last touched, bytes, name)] for every namespace.
+        namespaces = []
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return namespaces
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                touched = os.path.getmtime(path)
+                size = sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+            except OSError:
+                continue
+            namespaces.append((touched, size, name))
+        return namespaces
+
+    def reap(self, now=None):
+        # Returns the names of the namespaces removed.
+        now = now or time.time()
+        namespaces = sorted(self.usage())
+        total = sum(size for _, size, _ in namespaces)
+        removed = []
+        for touched, size, name in namespaces:
+            if now - touched <= self.max_age and total <= self.max_bytes:
+                continue
+            self.release(name)
+            total -= size
+            removed.append(name)
+        return removed
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name="artifact-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        while True:
+            try:
+                self.reap()
+            except Exception:
+                pass
+            time.sleep(self.reap_interval)
+
+
+artifact_store = ArtifactStore()
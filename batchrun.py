@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import chartrender
+import peergroup
+import pipeline
+import tracing
+from tickerresolver import resolve_tickers
+
+
+def _summary_path(output_dir, label, start_date, end_date):
+    label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label)
+    return os.path.join(output_dir, f"{label}_{start_date}_to_{end_date}_summary.json")
+
+
+def run_vendor(names, ticker, start_date, end_date, output_dir, force_refresh=False, interval=pipeline.REPORT_INTERVAL):
+    # Generates the report for one ticker once and writes a summary for each
+    # input name that resolved to it, all pointing at the same PDF.
+    started = time.perf_counter()
+    result = {
+        "start_date": str(start_date),
+        "end_date": str(end_date),
+        "status": "ok",
+        "error": None,
+        "pdf_filename": None,
+        "verdict": None,
+        "metrics": None,
+        "cached": False,
+        "sizes": None,
+    }
+    with tracing.span("vendor", input=names[0], ticker=ticker) as trace:
+        if not ticker:
+            result["status"] = "unresolved"
+            result["error"] = "Could not resolve a valid ticker symbol."
+        else:
+            try:
+                report = pipeline.cached_report(
+                    ticker, start_date, end_date, output_dir=output_dir, force_refresh=force_refresh, interval=interval,
+                    stream=False
+                )
+                result["pdf_filename"] = report["pdf_filename"]
+                result["cached"] = bool(report.get("cached"))
+                result["verdict"] = report["verdict"]
+                result["metrics"] = report["metrics"]
+                result["sizes"] = report.get("sizes")
+            except pipeline.ReportError as e:
+                result["status"] = "no_data"
+                result["error"] = str(e)
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    result["tokens"] = {k: v for k, v in trace.totals().items() if k.endswith("_tokens")}
+    result["trace"] = trace.waterfall()
+    summaries = []
+    for name in names:
+        summary = {"input": name, "ticker": ticker, **result}
+        with open(_summary_path(output_dir, name, start_date, end_date), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, default=str)
+        summaries.append(summary)
+    return summaries
+
+
+def write_comparison(tickers, start_date, end_date, output_dir):
+    # Portfolio view of the whole batch: one bulk price download, the ranking
+    # table as markdown and CSV, and the return correlation matrix as CSV.
+    analytics = pipeline.run_stage("download", peergroup.compare, tickers, start_date, end_date)
+    if analytics is None:
+        return None
+    base = os.path.join(output_dir, f"peer_comparison_{start_date}_to_{end_date}")
+    with open(f"{base}.md", "w", encoding="utf-8") as f:
+        f.write(peergroup.peer_table(analytics, max_rows=len(analytics["table"])) + "\n")
+    analytics["table"].to_csv(f"{base}.csv", float_format="%.4f")
+    analytics["correlation"].to_csv(f"{base}_correlation.csv", float_format="%.4f")
+    return f"{base}.md"
+
+
+def run_batch(names, start_date, end_date, output_dir="reports", workers=8, on_done=None, compare=False, force_refresh=False,
+              interval=pipeline.REPORT_INTERVAL):
+    # Resolves every name in one batch, then runs the report pipeline for each
+    # vendor on a bounded thread pool. Per-stage limits in pipeline.stage_limits
+    # keep yfinance and Azure within their concurrency and rate budgets. With
+    # compare, the resolved tickers are also ranked against each other first,
+    # which also fills the price store for the vendor reports in one download.
+    os.makedirs(output_dir, exist_ok=True)
+    chartrender.warm_up()
+    names = list(dict.fromkeys(n.strip() for n in names if n.strip()))
+    with tracing.span("resolve_tickers", names=len(names)), pipeline.stage_limits["resolve"]:
+        tickers = resolve_tickers(names)
+    if compare:
+        resolved = list(dict.fromkeys(t for t in tickers.values() if t))
+        if resolved:
+            # Best effort: the vendor reports do not depend on it
+            try:
+                write_comparison(resolved, start_date, end_date, output_dir)
+            except Exception:
+                pass
+    # Names resolving to the same ticker ("Microsoft", "MSFT") share one
+    # report; unresolved names are summarized one by one.
+    groups = {}
+    for name in names:
+        groups.setdefault(tickers.get(name) or (None, name), []).append(name)
+    summaries = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_vendor, group, tickers.get(group[0]), start_date, end_date, output_dir, force_refresh, interval)
+            for group in groups.values()
+        ]
+        for future in as_completed(futures):
+            for summary in future.result():
+                summaries.append(summary)
+                if on_done:
+                    on_done(summary)
+    order = {name: i for i, name in enumerate(names)}
+    summaries.sort(key=lambda s: order[s["input"]])
+    with open(os.path.join(output_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summaries, f, indent=2, default=str)
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate due diligence reports for many vendors.")
+    parser.add_argument("names", nargs="*", help="Company names or stock tickers")
+    parser.add_argument("--file", help="Text file with one company name or ticker per line")
+    parser.add_argument("--start", type=date.fromisoformat, default=date.today() - timedelta(days=365))
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--force-refresh", action="store_true", help="Regenerate reports even if cached")
+    parser.add_argument("--interval", default=pipeline.REPORT_INTERVAL, help="Price bar interval (1d, 1h, 5m, ...)")
+    parser.add_argument("--compare", action="store_true", help="Also write a peer comparison of all resolved tickers")
+    for stage in pipeline.STAGES:
+        parser.add_argument(f"--{stage}-concurrency", type=int, help=f"Max concurrent {stage} calls")
+        parser.add_argument(f"--{stage}-rate", type=float, help=f"Max {stage} calls started per second")
+    args = parser.parse_args(argv)
+
+    names = list(args.names)
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            names += [line for line in f.read().splitlines() if line.strip()]
+    if not names:
+        parser.error("no company names or tickers given")
+
+    concurrency, rates = {}, {}
+    for stage in pipeline.STAGES:
+        limit = getattr(args, f"{stage}_concurrency")
+        rate = getattr(args, f"{stage}_rate")
+        if limit or rate:
+            concurrency[stage] = limit or args.workers
+            rates[stage] = rate
+    pipeline.configure_limits(concurrency, rates)
+
+    def report(summary):
+        print(f"{summary['input']}: {summary['status']} ({summary['elapsed_seconds']}s) {summary['pdf_filename'] or summary['error']}")
+
+    summaries = run_batch(
+        names, args.start, args.end, output_dir=args.output_dir, workers=args.workers, on_done=report,
+        compare=args.compare, force_refresh=args.force_refresh, interval=args.interval
+    )
+    failed = sum(1 for s in summaries if s["status"] != "ok")
+    print(f"{len(summaries) - failed}/{len(summaries)} reports generated in {args.output_dir}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,510 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw
+from azure.ai.projects.models import AgentStreamEvent, MessageDeltaChunk, ThreadMessage, ThreadRun
+
+import agentpool
+import chartrender
+import downsample
+import pipeline
+import pricestore
+import tracing
+import uploadcache
+from config import CACHE_DIR
+from report import Report
+
+BENCHMARK_DIR = os.path.join(CACHE_DIR, "benchmarks")
+# Modules the app should not import until a report is generated
+HEAVY_MODULES = ("azure.ai.projects", "azure.identity", "yfinance", "fpdf", "altair", "matplotlib")
+
+# Runs the Streamlit app in a fresh interpreter: the first run is the cold
+# start, the following ones are reruns without any interaction.
+STARTUP_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("duechat.py", default_timeout=120)
+started = time.perf_counter()
+app.run()
+cold = time.perf_counter() - started
+heavy = [m for m in {heavy!r} if m in sys.modules]
+reruns = []
+for _ in range({reruns}):
+    started = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - started)
+print(json.dumps({{"cold": cold, "reruns": reruns, "heavy": heavy, "error": [str(e.value) for e in app.exception]}}))
+"""
+
+CANNED_ANALYSIS = """## Stock Performance
+The stock moved within a moderate range over the period with no extreme drawdowns.
+
+## Technical Indicators
+| Metric | Reading |
+| --- | --- |
+| Trend | Above the 50 and 200 day moving averages |
+| Momentum | RSI in neutral territory |
+| Risk | Volatility in line with the benchmark |
+
+## Market Research
+Recent news coverage is balanced and no material legal or regulatory events were found.
+
+**Conclusion:** Due diligence passed."""
+
+
+def synthetic_download(tickers, start=None, end=None, interval="1d", progress=False, **kwargs):
+    # Stand-in for yf.download: a seeded random walk per ticker on business
+    # days in [start, end) (intraday bars between 9:30 and 16:00), in
+    # yfinance's (Price, Ticker) column layout.
+    symbols = [tickers] if isinstance(tickers, str) else list(tickers)
+    index = pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1), name="Date")
+    if downsample.is_intraday(interval):
+        step = pd.Timedelta(interval.replace("m", "min"))
+        session = pd.timedelta_range("9h30min", "16h", freq=step, closed="left")
+        index = pd.DatetimeIndex((index.values[:, None] + session.values[None, :]).ravel(), name="Date")
+    columns = {}
+    for symbol in symbols:
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+        close = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(index))))
+        spread = close * rng.uniform(0.002, 0.02, len(index))
+        columns[("Close", symbol)] = close
+        columns[("High", symbol)] = close + spread
+        columns[("Low", symbol)] = close - spread
+        columns[("Open", symbol)] = close + rng.uniform(-1, 1, len(index)) * spread
+        columns[("Volume", symbol)] = rng.integers(1_000_000, 50_000_000, len(index))
+    frame = pd.DataFrame(columns, index=index)
+    frame.columns = pd.MultiIndex.from_tuples(frame.columns, names=["Price", "Ticker"])
+    return frame
+
+
+def _chart_png():
+    image = Image.new("RGB", (800, 450), "white")
+    draw = ImageDraw.Draw(image)
+    rng = np.random.default_rng(0)
+    ys = 225 - np.cumsum(rng.normal(0, 6, 780))
+    draw.line(list(zip(range(10, 790), np.clip(ys, 10, 440).tolist())), fill="navy", width=2)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeMessages(dict):
+    # list_messages result: subscriptable like the SDK page and exposing
+    # image_contents, from which pipeline.save_charts saves every chart.
+    def __init__(self, data, image_file_ids):
+        super().__init__(data=data)
+        self.image_contents = [SimpleNamespace(image_file=SimpleNamespace(file_id=f)) for f in image_file_ids]
+
+
+class FakeAgents:
+    # Simulates the agents API surface the app uses. Every run sleeps for
+    # run_latency and answers with the canned analysis and one chart.
+    def __init__(self, run_latency=2.0, upload_latency=0.3, call_latency=0.05, token_latency=0.002,
+                 response=CANNED_ANALYSIS, charts_per_run=1):
+        self.run_latency = run_latency
+        self.upload_latency = upload_latency
+        self.call_latency = call_latency
+        self.token_latency = token_latency
+        self.response = response
+        self.charts_per_run = charts_per_run
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._runs = {}
+        self._png = _chart_png()
+
+    def _id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    def _usage(self, thread_id, instructions, additional_instructions):
+        prompt_chars = sum(len(m) for m in self._threads.get(thread_id, [])) + len(instructions or "") + len(additional_instructions or "")
+        return SimpleNamespace(prompt_tokens=prompt_chars // 4, completion_tokens=len(self.response) // 4, total_tokens=None)
+
+    def create_agent(self, model, name, instructions, toolset=None):
+        time.sleep(self.call_latency)
+        return SimpleNamespace(id=self._id("asst"), name=name)
+
+    def delete_agent(self, agent_id):
+        pass
+
+    def create_thread(self):
+        time.sleep(self.call_latency)
+        thread_id = self._id("thread")
+        with self._lock:
+            self._threads[thread_id] = []
+        return SimpleNamespace(id=thread_id)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def create_message(self, thread_id, role, content, attachments=None):
+        time.sleep(self.call_latency)
+        with self._lock:
+            self._threads.setdefault(thread_id, []).append(content)
+        return SimpleNamespace(id=self._id("msg"))
+
+    def create_and_process_run(self, thread_id, agent_id, instructions=None, additional_instructions=None):
+        time.sleep(self.run_latency)
+        return SimpleNamespace(
+            id=self._id("run"), status="completed", usage=self._usage(thread_id, instructions, additional_instructions)
+        )
+
+    def create_run(self, thread_id, agent_id, instructions=None, additional_instructions=None):
+        run = SimpleNamespace(
+            id=self._id("run"), status="queued", usage=self._usage(thread_id, instructions, additional_instructions)
+        )
+        with self._lock:
+            self._runs[run.id] = (time.monotonic() + self.run_latency, run)
+        return run
+
+    def get_run(self, thread_id, run_id):
+        with self._lock:
+            done_at, run = self._runs[run_id]
+        run.status = "completed" if time.monotonic() >= done_at else "in_progress"
+        return run
+
+    def cancel_run(self, thread_id, run_id):
+        with self._lock:
+            self._runs[run_id][1].status = "cancelled"
+
+    def list_messages(self, thread_id):
+        time.sleep(self.call_latency)
+        image_ids = [self._id("file") for _ in range(self.charts_per_run)]
+        data = [{
+            "role": "assistant",
+            "content": [{"type": "text", "text": {"value": self.response}}]
+            + [{"type": "image_file", "image_file": {"file_id": f}} for f in image_ids],
+        }]
+        return FakeMessages(data, image_ids)
+
+    @contextlib.contextmanager
+    def create_stream(self, thread_id, agent_id, instructions=None, additional_instructions=None):
+        # Same total latency as a batch run: a pause before the first token,
+        # then the response word by word.
+        usage = self._usage(thread_id, instructions, additional_instructions)
+        words = self.response.split(" ")
+        first_token = max(self.run_latency - self.token_latency * len(words), 0)
+        message_id = self._id("msg")
+
+        def events():
+            time.sleep(first_token)
+            for i, word in enumerate(words):
+                time.sleep(self.token_latency)
+                chunk = MessageDeltaChunk({
+                    "id": message_id, "object": "thread.message.delta",
+                    "delta": {"role": "assistant", "content": [
+                        {"index": 0, "type": "text", "text": {"value": word if i == 0 else " " + word}}
+                    ]},
+                })
+                yield AgentStreamEvent.THREAD_MESSAGE_DELTA, chunk, None
+            content = [{"type": "text", "text": {"value": self.response, "annotations": []}}]
+            content += [{"type": "image_file", "image_file": {"file_id": self._id("file")}} for _ in range(self.charts_per_run)]
+            message = ThreadMessage({"id": message_id, "object": "thread.message", "role": "assistant", "content": content})
+            yield AgentStreamEvent.THREAD_MESSAGE_COMPLETED, message, None
+            run = ThreadRun({
+                "id": self._id("run"), "object": "thread.run", "status": "completed",
+                "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens, "total_tokens": 0},
+            })
+            yield AgentStreamEvent.THREAD_RUN_COMPLETED, run, None
+
+        yield events()
+
+    def upload_file_and_poll(self, file=None, file_path=None, purpose=None, filename=None, sleep_interval=1):
+        time.sleep(self.upload_latency)
+        return SimpleNamespace(id=self._id("file"), filename=filename or os.path.basename(file_path))
+
+    def delete_file(self, file_id):
+        pass
+
+    def save_file(self, file_id, file_name, target_dir=None):
+        time.sleep(self.call_latency)
+        with open(os.path.join(target_dir or ".", file_name), "wb") as f:
+            f.write(self._png)
+
+
+class FakeProjectClient:
+    def __init__(self, **agent_options):
+        self.agents = FakeAgents(**agent_options)
+        self.connections = SimpleNamespace(get=lambda connection_name: SimpleNamespace(id="bing-connection"))
+
+
+def install_fakes(work_dir, **agent_options):
+    # Points the shared client, price store, upload and chart caches, traces
+    # and metrics at local stand-ins under work_dir.
+    client = FakeProjectClient(**agent_options)
+    agentpool.set_project_client(client)
+    pricestore.price_store = pricestore.PriceStore(
+        root=os.path.join(work_dir, "prices"), downloader=synthetic_download
+    )
+    # Synthetic intraday bars exist for any range, so long intraday ranges
+    # can still be measured
+    pricestore.INTRADAY_RETENTION_DAYS = {}
+    uploadcache.upload_cache = uploadcache.UploadCache(path=os.path.join(work_dir, "uploads.json"))
+    chartrender.CHART_CACHE_DIR = os.path.join(work_dir, "charts")
+    tracing.TRACE_LOG_PATH = ""
+    tracing.METRICS_PATH = os.path.join(work_dir, "metrics.prom")
+    return client
+
+
+def _ticker(i):
+    return f"SYN{i:03d}"
+
+
+def _stage_times(trace):
+    # Total seconds per pipeline stage below generate_report.
+    stages = {}
+    for span, depth in trace.walk():
+        if span.name in pipeline.STAGES and span.duration is not None:
+            stages[span.name] = stages.get(span.name, 0.0) + span.duration
+    return stages
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def bench_latency(runs, start_date, end_date, output_dir, stream):
+    latencies, stages = [], {}
+    for i in range(runs):
+        with tracing.span("benchmark") as trace:
+            started = time.perf_counter()
+            pipeline.generate_report(_ticker(i), start_date, end_date, output_dir=output_dir, stream=stream)
+            latencies.append(time.perf_counter() - started)
+        for stage, seconds in _stage_times(trace).items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "runs": runs,
+        "mean": statistics.mean(latencies),
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "stages": {stage: statistics.mean(values) for stage, values in stages.items()},
+    }
+
+
+def bench_throughput(reports, concurrency, start_date, end_date, output_dir, stream):
+    failures = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(pipeline.generate_report, _ticker(1000 + i), start_date, end_date, output_dir=output_dir, stream=stream)
+            for i in range(reports)
+        ]
+        for future in futures:
+            if future.exception() is not None:
+                failures += 1
+    wall = time.perf_counter() - started
+    return {
+        "reports": reports,
+        "concurrency": concurrency,
+        "failures": failures,
+        "wall_seconds": wall,
+        "reports_per_second": reports / wall if wall else None,
+    }
+
+
+def bench_render(line_counts, chart_path, repeats=3):
+    # Layout plus PDF output time for reports of increasing length.
+    filler = "Revenue, margins and liquidity were reviewed against the sector median for the period."
+    results = []
+    for count in line_counts:
+        lines = []
+        for i in range(count):
+            lines.append(f"## Section {i // 20 + 1}" if i % 20 == 0 else f"{i}. {filler}")
+        timings, size = [], 0
+        for _ in range(repeats):
+            report = Report("SYN", "2024-01-01", "2024-12-31")
+            report.add_section("agent", lines, charts=[chart_path] * max(1, count // 200))
+            started = time.perf_counter()
+            size = len(report.to_pdf_bytes())
+            timings.append(time.perf_counter() - started)
+        results.append({"lines": count, "seconds": min(timings), "pdf_bytes": size})
+    return results
+
+
+def bench_memory(start_date, end_date, output_dir, stream, interval="1d"):
+    # Peak traced memory of one cold report plus its price data and payload
+    # sizes; run again for a long intraday range with --interval.
+    tracemalloc.start()
+    try:
+        result = pipeline.generate_report(
+            _ticker(9999), start_date, end_date, output_dir=output_dir, stream=stream, interval=interval
+        )
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() != "Darwin":
+        max_rss *= 1024
+    return {"report_peak_mb": peak / 2**20, "process_max_rss_mb": max_rss / 2**20, "sizes": result["sizes"]}
+
+
+def bench_startup(reruns, work_dir):
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, DUEDILIGENCE_CACHE_DIR=work_dir, ARTIFACT_DIR=os.path.join(work_dir, "artifacts"))
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT.format(heavy=HEAVY_MODULES, reruns=reruns)],
+        cwd=app_dir, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    process = time.perf_counter() - started
+    measured = json.loads(output.strip().splitlines()[-1])
+    return {
+        "process_seconds": process,
+        "cold_start": measured["cold"],
+        "rerun_p50": _percentile(measured["reruns"], 50),
+        "rerun_p95": _percentile(measured["reruns"], 95),
+        "heavy_modules_loaded": measured["heavy"],
+        "errors": measured["error"],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _flatten(item, f"{prefix}{key}.")
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            label = item.get("lines", i) if isinstance(item, dict) else i
+            yield from _flatten(item, f"{prefix}{label}.")
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix.rstrip("."), value
+
+
+def compare(previous, current):
+    old = dict(_flatten(previous["results"]))
+    lines = [f"Compared with {previous.get('commit') or 'unknown'} ({previous.get('created')}):"]
+    for key, value in _flatten(current["results"]):
+        if key.rsplit(".", 1)[-1] in ("runs", "reports", "concurrency", "lines"):
+            continue
+        if key in old and old[key]:
+            change = (value - old[key]) / abs(old[key]) * 100
+            lines.append(f"  {key}: {old[key]:.4g} -> {value:.4g} ({change:+.1f}%)")
+    return "\n".join(lines)
+
+
+def run_benchmarks(args):
+    with tempfile.TemporaryDirectory(prefix="ddbench_") as work_dir:
+        client = install_fakes(
+            work_dir,
+            run_latency=args.run_latency,
+            upload_latency=args.upload_latency,
+            call_latency=args.call_latency,
+            token_latency=args.token_latency,
+        )
+        chartrender.warm_up()
+        if args.no_limits:
+            pipeline.configure_limits({stage: max(args.concurrency, 1) * 4 for stage in pipeline.STAGES})
+        chart_path = os.path.join(work_dir, "chart.png")
+        with open(chart_path, "wb") as f:
+            f.write(client.agents._png)
+        output_dir = os.path.join(work_dir, "reports")
+        os.makedirs(output_dir)
+        end_date = date.today()
+        start_date = end_date - timedelta(days=args.days)
+
+        results = {}
+        results["startup"] = bench_startup(args.startup_reruns, work_dir)
+        results["latency"] = bench_latency(args.runs, start_date, end_date, output_dir, args.stream)
+        results["throughput"] = bench_throughput(
+            args.reports, args.concurrency, start_date, end_date, output_dir, args.stream
+        )
+        results["render"] = bench_render(args.render_lines, chart_path)
+        results["memory"] = bench_memory(start_date, end_date, output_dir, args.stream, args.interval)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the report pipeline offline against local stand-ins for Azure agents and yfinance."
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Sequential reports for the latency measurement")
+    parser.add_argument("--reports", type=int, default=20, help="Reports for the throughput measurement")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent reports for the throughput measurement")
+    parser.add_argument("--days", type=int, default=365, help="Length of the report date range")
+    parser.add_argument("--interval", default="1d", help="Bar interval for the memory measurement (1d, 1h, 5m, ...)")
+    parser.add_argument("--startup-reruns", type=int, default=20, help="App reruns after the cold start")
+    parser.add_argument("--render-lines", type=int, nargs="+", default=[50, 500, 2000])
+    parser.add_argument("--run-latency", type=float, default=2.0, help="Seconds per simulated agent run")
+    parser.add_argument("--upload-latency", type=float, default=0.3)
+    parser.add_argument("--call-latency", type=float, default=0.05, help="Seconds per other simulated API call")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Seconds per streamed word")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=pipeline.STREAM_AGENT_OUTPUT)
+    parser.add_argument("--no-limits", action="store_true", help="Lift the per-stage concurrency and rate limits")
+    parser.add_argument("--output", help="Results file (default: a timestamped file in .cache/benchmarks)")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    created = datetime.now(timezone.utc)
+    commit = _git_commit()
+    result = {
+        "created": created.isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": run_benchmarks(args),
+    }
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, f"{created:%Y%m%dT%H%M%S}_{commit or 'nocommit'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    startup, latency, throughput, memory = (result["results"][k] for k in ("startup", "latency", "throughput", "memory"))
+    print(
+        f"startup: cold {startup['cold_start']:.2f}s (process {startup['process_seconds']:.2f}s), "
+        f"rerun p50 {startup['rerun_p50'] * 1000:.0f}ms p95 {startup['rerun_p95'] * 1000:.0f}ms, "
+        f"heavy modules at start: {', '.join(startup['heavy_modules_loaded']) or 'none'}"
+    )
+    print(f"latency: mean {latency['mean']:.2f}s p50 {latency['p50']:.2f}s p95 {latency['p95']:.2f}s")
+    print("  stages: " + ", ".join(f"{k} {v:.2f}s" for k, v in latency["stages"].items()))
+    print(
+        f"throughput: {throughput['reports']} reports x{throughput['concurrency']} in "
+        f"{throughput['wall_seconds']:.2f}s ({throughput['reports_per_second']:.2f}/s, {throughput['failures']} failed)"
+    )
+    for row in result["results"]["render"]:
+        print(f"render: {row['lines']} lines {row['seconds'] * 1000:.0f}ms ({row['pdf_bytes']} bytes)")
+    print(f"memory: report peak {memory['report_peak_mb']:.1f}MB, process max RSS {memory['process_max_rss_mb']:.1f}MB")
+    sizes = memory["sizes"]
+    print(
+        f"  data: {sizes['rows']} {sizes['interval']} bars, {sizes['data_bytes'] / 2**20:.1f}MB in memory, "
+        f"payload {sizes['payload_rows']} rows {sizes['payload_bytes'] / 1024:.0f}KB"
+    )
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print(compare(json.load(f), result))
+    print(f"Results saved to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,266 @@
+import atexit
+import contextvars
+import hashlib
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import pandas as pd
+
+import downsample
+import tracing
+from config import CACHE_DIR, env_flag
+
+CHART_CACHE_DIR = os.path.join(CACHE_DIR, "charts")
+CHART_CACHE_MAX_FILES = int(os.getenv("CHART_CACHE_MAX_FILES", 500))
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", min(4, os.cpu_count() or 1)))
+CHART_TIMEOUT = float(os.getenv("CHART_TIMEOUT", 60))
+LOCAL_CHARTS = env_flag("LOCAL_CHARTS", True)
+# Points per chart after LTTB downsampling; about two per horizontal pixel
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 1600))
+CHART_SIZE = (8, 3.5)
+CHART_DPI = 100
+
+# Chart type -> indicator frame columns it is drawn from
+CHART_TYPES = {
+    "price": ("Close", "SMA_20", "SMA_50", "SMA_200"),
+    "volatility": ("Volatility_20d",),
+    "rsi": ("RSI_14",),
+    "macd": ("MACD", "MACD_Signal", "MACD_Hist"),
+    "drawdown": ("Drawdown",),
+}
+CHART_TITLES = {
+    "price": "Close with 20/50/200 day SMA",
+    "volatility": "20 day rolling volatility (annualized, %)",
+    "rsi": "RSI (14)",
+    "macd": "MACD (12, 26, 9)",
+    "drawdown": "Drawdown from running peak (%)",
+}
+
+_pool_lock = threading.Lock()
+_pool = None
+_warmed = False
+# Cache paths used by reports still in progress; prune_cache keeps them
+_active_lock = threading.Lock()
+_active = Counter()
+_holds = contextvars.ContextVar("chart_holds", default=None)
+
+
+def _render_chart(chart_type, frame, title, path):
+    # Runs in a worker process. Uses the object-oriented Figure API so no
+    # pyplot/GUI backend is involved; the file is written atomically.
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=CHART_SIZE, dpi=CHART_DPI)
+    ax = fig.subplots()
+    index = frame.index
+    if chart_type == "price":
+        ax.plot(index, frame["Close"], label="Close", color="black", linewidth=1.2)
+        for column, color in (("SMA_20", "tab:blue"), ("SMA_50", "tab:orange"), ("SMA_200", "tab:red")):
+            if frame[column].notna().any():
+                ax.plot(index, frame[column], label=column.replace("_", " "), color=color, linewidth=0.9)
+        ax.legend(loc="upper left", fontsize=7)
+    elif chart_type == "volatility":
+        ax.plot(index, frame["Volatility_20d"] * 100, color="tab:purple", linewidth=1)
+    elif chart_type == "rsi":
+        ax.plot(index, frame["RSI_14"], color="tab:blue", linewidth=1)
+        ax.axhline(70, color="tab:red", linestyle="--", linewidth=0.8)
+        ax.axhline(30, color="tab:green", linestyle="--", linewidth=0.8)
+        ax.set_ylim(0, 100)
+    elif chart_type == "macd":
+        # fill_between instead of bar: one polygon rather than a patch per day
+        ax.fill_between(index, frame["MACD_Hist"], 0, color="lightgray", step="mid")
+        ax.plot(index, frame["MACD"], label="MACD", color="tab:blue", linewidth=1)
+        ax.plot(index, frame["MACD_Signal"], label="Signal", color="tab:orange", linewidth=1)
+        ax.legend(loc="upper left", fontsize=7)
+    elif chart_type == "drawdown":
+        ax.fill_between(index, frame["Drawdown"] * 100, 0, color="tab:red", alpha=0.4)
+    ax.set_title(title, fontsize=10)
+    ax.grid(True, alpha=0.3)
+    ax.tick_params(labelsize=7)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp_path, format="png", metadata={"Software": None})
+    os.replace(tmp_path, path)
+    return path
+
+
+def _get_pool():
+    # Spawned workers: forking a process that already runs Streamlit or
+    # agent threads is not safe.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+@contextmanager
+def _hidden_main():
+    # Streamlit runs the app script as __main__ and spawn would re-execute it
+    # in every new worker; workers only need this module, so the script is
+    # hidden while submit() may start them.
+    main = sys.modules.get("__main__")
+    if getattr(main, "__file__", None) is None:
+        yield
+        return
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def _submit(fn, *args):
+    global _pool
+    pool = _get_pool()
+    try:
+        with _pool_lock, _hidden_main():
+            return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool on the next call
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+
+def _warm():
+    import matplotlib.figure  # noqa: F401
+    return os.getpid()
+
+
+def warm_up():
+    # Starts the workers and imports matplotlib in them ahead of the first
+    # report, hiding the spawn cost behind ticker resolution and download.
+    global _warmed
+    if LOCAL_CHARTS and not _warmed:
+        _warmed = True
+        try:
+            for _ in range(CHART_WORKERS):
+                _submit(_warm)
+        except RuntimeError:
+            pass
+
+
+def _shutdown():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown)
+
+
+def data_hash(frame):
+    return hashlib.sha256(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes()).hexdigest()[:16]
+
+
+def chart_path(ticker, start_date, end_date, chart_type, digest, cache_dir=None):
+    return os.path.join(cache_dir or CHART_CACHE_DIR, f"{ticker}_{start_date}_to_{end_date}_{chart_type}_{digest}.png")
+
+
+def is_cached_chart(path, cache_dir=None):
+    return os.path.abspath(path).startswith(os.path.abspath(cache_dir or CHART_CACHE_DIR) + os.sep)
+
+
+def _hold(paths):
+    # Pins paths until the enclosing charts_in_use block exits; outside of
+    # one nothing is pinned.
+    holds = _holds.get()
+    if holds is None:
+        return
+    paths = [os.path.abspath(p) for p in paths]
+    with _active_lock:
+        _active.update(paths)
+    holds.extend(paths)
+
+
+@contextmanager
+def charts_in_use(paths=()):
+    # Charts submitted inside the block, and the given paths, are kept by
+    # prune_cache until the block exits.
+    holds = []
+    token = _holds.set(holds)
+    try:
+        _hold(paths)
+        yield
+    finally:
+        _holds.reset(token)
+        with _active_lock:
+            _active.subtract(holds)
+            for path in holds:
+                if _active[path] <= 0:
+                    del _active[path]
+
+
+def submit_charts(ticker, start_date, end_date, frame, chart_types=tuple(CHART_TYPES), cache_dir=None, max_points=CHART_MAX_POINTS):
+    # Starts rendering the standard chart set from an indicator frame and
+    # returns one future per chart type resolving to its PNG path. Long
+    # frames are reduced to max_points per chart with LTTB before they are
+    # sent to a worker. Charts are cached on disk by (ticker, range, chart
+    # type, data hash); cached ones come back as already completed futures.
+    cache_dir = cache_dir or CHART_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    futures = []
+    for chart_type in chart_types:
+        data = downsample.lttb_frame(frame[list(CHART_TYPES[chart_type])], max_points)
+        tracing.add(chart_points=len(data))
+        path = chart_path(ticker, start_date, end_date, chart_type, data_hash(data), cache_dir)
+        _hold([path])
+        try:
+            # A hit counts as recent use for prune_cache
+            os.utime(path)
+            cached = True
+        except OSError:
+            cached = False
+        if cached:
+            future = Future()
+            future.set_result(path)
+        else:
+            title = f"{ticker} - {CHART_TITLES[chart_type]}"
+            try:
+                future = _submit(_render_chart, chart_type, data, title, path)
+            except RuntimeError:
+                # Pool is shut down or broken; render in this thread instead
+                future = Future()
+                future.set_result(_render_chart(chart_type, data, title, path))
+        futures.append(future)
+    return futures
+
+
+def collect_charts(futures, timeout=CHART_TIMEOUT):
+    # Paths of the charts that rendered in time, in submission order.
+    with tracing.span("charts", requested=len(futures)) as span:
+        wait(futures, timeout=timeout)
+        paths = [f.result() for f in futures if f.done() and not f.cancelled() and f.exception() is None]
+        span.add(rendered=len(paths))
+    return paths
+
+
+def prune_cache(cache_dir=None, max_files=CHART_CACHE_MAX_FILES):
+    # Keeps the most recently used max_files charts; charts held by a report
+    # still in progress are never removed.
+    try:
+        entries = [e for e in os.scandir(cache_dir or CHART_CACHE_DIR) if e.name.endswith(".png")]
+    except OSError:
+        return
+    with _active_lock:
+        entries = [e for e in entries if os.path.abspath(e.path) not in _active]
+    if len(entries) <= max_files:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[max_files:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
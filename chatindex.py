@@ -0,0 +1,190 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import agentpool
+import tracing
+
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 30
+TOP_K = 4
+INDEX_CACHE_SIZE = 32
+# Token budget for the excerpts sent with one question
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", 1200))
+CHAT_INSTRUCTIONS = (
+    "Answer using the report excerpts sent in this conversation. "
+    "If they do not contain the answer, say so."
+)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "what", "which", "with",
+}
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.%][a-z0-9]+)*")
+_HEADING_RE = re.compile(r"^\s*(#{1,6}\s|\*\*[^*]+\*\*\s*$|---\s*$)")
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def split_sections(text):
+    # Splits on markdown headings, bold-only lines and --- separators, keeping
+    # each heading with the body that follows it.
+    sections = []
+    title, body = "", []
+    for line in text.split("\n"):
+        if _HEADING_RE.match(line) and body:
+            sections.append((title, "\n".join(body).strip()))
+            title, body = "", []
+        if _HEADING_RE.match(line) and not title:
+            title = line.strip().strip("#* -")
+        body.append(line)
+    if body:
+        sections.append((title, "\n".join(body).strip()))
+    return [(t, b) for t, b in sections if b.strip("-* \n")]
+
+
+def chunk_report(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    chunks = []
+    for title, body in split_sections(text):
+        words = body.split()
+        if len(words) <= chunk_words:
+            chunks.append({"section": title, "text": body})
+            continue
+        step = chunk_words - overlap
+        for start in range(0, len(words), step):
+            piece = " ".join(words[start:start + chunk_words])
+            chunks.append({"section": title, "text": piece if not title or start == 0 else f"{title}: {piece}"})
+            if start + chunk_words >= len(words):
+                break
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self._tfs = [Counter(tokenize(c["section"] + " " + c["text"])) for c in chunks]
+        self._lengths = [sum(tf.values()) for tf in self._tfs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        df = Counter()
+        for tf in self._tfs:
+            df.update(tf.keys())
+        n = len(chunks)
+        self._idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()}
+
+    def search(self, query, k=TOP_K):
+        terms = [t for t in tokenize(query) if t in self._idf]
+        if not terms:
+            return []
+        scores = []
+        for i, tf in enumerate(self._tfs):
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        return [i for _, i in scores[:k]]
+
+
+_index_lock = threading.Lock()
+_index_cache = OrderedDict()
+
+
+def report_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_index(text):
+    # Indexes a report once per process; reruns and new sessions reuse it.
+    key = report_key(text)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is not None:
+            _index_cache.move_to_end(key)
+            return index
+    index = BM25Index(chunk_report(text))
+    with _index_lock:
+        _index_cache[key] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+
+class ReportChat:
+    # One agent thread per report session. Each question carries only the top-k
+    # chunks that have not already been sent on this thread; earlier chunks are
+    # still in the thread history for follow-up questions.
+    def __init__(self, report_text, top_k=TOP_K, max_tokens=CHAT_CONTEXT_TOKENS):
+        self.report_key = report_key(report_text)
+        self.index = get_index(report_text)
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        self.thread_id = None
+        self._sent = set()
+
+    def context_for(self, question):
+        hits = self.index.search(question, self.top_k)
+        if not hits and not self._sent:
+            hits = list(range(min(self.top_k, len(self.index.chunks))))
+        new = []
+        budget = self.max_tokens
+        # Best hit first; lower ranked chunks only while they fit the budget
+        for i in hits:
+            if i in self._sent:
+                continue
+            size = (len(self.index.chunks[i]["text"]) + 3) // 4
+            if new and size > budget:
+                break
+            new.append(i)
+            budget -= size
+        return new, "\n\n".join(
+            f"[{self.index.chunks[i]['section'] or 'Report'}]\n{self.index.chunks[i]['text']}" for i in new
+        )
+
+    def _message(self, question):
+        new, context = self.context_for(question)
+        content = question
+        if context:
+            content = f"Relevant report excerpts:\n{context}\n\nQuestion: {question}"
+        return new, content
+
+    def ask(self, question):
+        with tracing.span("chat", report=self.report_key[:12]) as span:
+            new, content = self._message(question)
+            span.add(chunks=len(new))
+            self.thread_id, messages = agentpool.run_agent(
+                "pdf-chat-agent",
+                content,
+                thread_id=self.thread_id,
+                additional_instructions=CHAT_INSTRUCTIONS
+            )
+        self._sent.update(new)
+        texts = agentpool.assistant_texts(messages)
+        return texts[0] if texts else ""
+
+    def ask_stream(self, question):
+        # Yields the answer text as it is generated.
+        new, content = self._message(question)
+        for kind, value in agentpool.stream_agent(
+            "pdf-chat-agent", content, thread_id=self.thread_id, additional_instructions=CHAT_INSTRUCTIONS
+        ):
+            if kind == "thread":
+                self.thread_id = value
+            elif kind == "text":
+                yield value
+        self._sent.update(new)
+
+    def close(self):
+        if self.thread_id:
+            agentpool.delete_thread(self.thread_id)
+            self.thread_id = None
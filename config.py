@@ -0,0 +1,15 @@
+import os
+
+# Root of every local cache (price store, uploads, charts, reports, artifacts, traces)
+CACHE_DIR = os.getenv("DUEDILIGENCE_CACHE_DIR", ".cache")
+
+
+def env_flag(name, default=False):
+    # "1"/"true"/"yes" turn a flag on and "0"/"false"/"no" turn it off (any
+    # case); unset or anything else keeps the default.
+    value = os.getenv(name, "").strip().lower()
+    if value in ("1", "true", "yes"):
+        return True
+    if value in ("0", "false", "no"):
+        return False
+    return default
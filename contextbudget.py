@@ -0,0 +1,109 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import tracing
+from chatindex import split_sections
+
+# Rough size of a token for English/markdown text; close enough to budget
+# prompts without a tokenizer dependency.
+CHARS_PER_TOKEN = 4
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+MIN_SUMMARY_TOKENS = 150
+SUMMARY_CACHE_SIZE = 128
+SUMMARY_LINE_CHARS = 240
+
+# Lines carrying conclusions or risks are kept ahead of the rest of a section
+_KEY_LINE_RE = re.compile(
+    r"\b(pass(ed)?|fail(ed)?|conclu\w*|recommend\w*|risk\w*|verdict|overall|summary|not available|missing)\b", re.I
+)
+_SEPARATOR_RE = re.compile(r"^\s*\|?[\s:|-]+\|?\s*$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+_summary_lock = threading.Lock()
+_summary_cache = OrderedDict()
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def _candidates(text):
+    # (priority, position, line) for every line worth keeping; lower priority
+    # values are kept first. Headings come first, then conclusion/risk lines,
+    # then the opening line of each section, then table rows, then the rest.
+    lines = []
+    position = 0
+    for title, body in split_sections(text):
+        first = True
+        for line in body.split("\n"):
+            line = line.strip()
+            if not line or _SEPARATOR_RE.match(line):
+                continue
+            position += 1
+            if len(line) > SUMMARY_LINE_CHARS:
+                line = _SENTENCE_RE.split(line, 1)[0][:SUMMARY_LINE_CHARS]
+            if title and line.strip("#* -") == title:
+                priority = 0
+            elif _KEY_LINE_RE.search(line):
+                priority = 1
+            elif first:
+                priority = 2
+            elif line.startswith("|"):
+                priority = 3
+            else:
+                priority = 4
+            if priority:
+                first = False
+            lines.append((priority, position, line))
+    return lines
+
+
+def summarize(text, max_tokens):
+    # Extractive summary of a long analysis within max_tokens: section
+    # headings, conclusion and risk lines, section openings and table rows,
+    # in their original order. Cached by content hash.
+    key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), max_tokens)
+    with _summary_lock:
+        summary = _summary_cache.get(key)
+        if summary is not None:
+            _summary_cache.move_to_end(key)
+            return summary
+    budget = max_tokens * CHARS_PER_TOKEN
+    kept = []
+    for priority, position, line in sorted(_candidates(text)):
+        if len(line) + 1 > budget:
+            continue
+        kept.append((position, line))
+        budget -= len(line) + 1
+    summary = "\n".join(line for _, line in sorted(kept))
+    with _summary_lock:
+        _summary_cache[key] = summary
+        while len(_summary_cache) > SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+    return summary
+
+
+def fit(parts, budget=CONTEXT_TOKEN_BUDGET):
+    # Joins (label, text, compressible) parts into one prompt of about budget
+    # tokens. Fixed parts are always kept as is; if the total is over budget
+    # the compressible ones are replaced by summaries sharing what is left in
+    # proportion to their size. Estimates are recorded on the current span.
+    sizes = [estimate_tokens(text) for _, text, _ in parts]
+    raw = sum(sizes)
+    flexible = sum(size for size, (_, _, compressible) in zip(sizes, parts) if compressible)
+    available = max(budget - (raw - flexible), 0)
+    texts = []
+    for size, (label, text, compressible) in zip(sizes, parts):
+        if not text:
+            continue
+        if compressible and raw > budget and flexible:
+            share = max(MIN_SUMMARY_TOKENS, available * size // flexible)
+            if size > share:
+                text = summarize(text, share)
+        texts.append(f"{label}:\n{text}" if label else text)
+    joined = "\n\n".join(texts)
+    tracing.add(context_tokens=estimate_tokens(joined), context_tokens_raw=raw)
+    return joined
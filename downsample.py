@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# How each yf.download column is aggregated into a coarser bar
+OHLC_RULES = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Adj Close": "last", "Volume": "sum"}
+# Resampling ladder (rule, approximate bar length), finest first
+RESAMPLE_RULES = (
+    ("5min", pd.Timedelta(minutes=5)),
+    ("15min", pd.Timedelta(minutes=15)),
+    ("30min", pd.Timedelta(minutes=30)),
+    ("1h", pd.Timedelta(hours=1)),
+    ("1D", pd.Timedelta(days=1)),
+    ("W-FRI", pd.Timedelta(days=7)),
+    ("ME", pd.Timedelta(days=30)),
+    ("QE", pd.Timedelta(days=91)),
+)
+INTRADAY_INTERVALS = ("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h")
+
+
+def is_intraday(interval):
+    return interval in INTRADAY_INTERVALS
+
+
+def ohlc_resample(data, rule):
+    # Coarser OHLCV bars: first open, highest high, lowest low, last close and
+    # summed volume per bucket. Buckets without any bar are dropped.
+    rules = {c: OHLC_RULES.get(c, "last") for c in data.columns}
+    resampler = data.resample(rule)
+    frame = resampler.agg(rules)
+    return frame[resampler.size() > 0]
+
+
+def ohlc_downsample(data, max_rows):
+    # data resampled to the finest rule of the ladder that yields at most
+    # max_rows bars; unchanged when it already fits.
+    if len(data) <= max_rows or len(data) < 2:
+        return data
+    step = pd.Series(data.index).diff().median()
+    frame = data
+    for rule, length in RESAMPLE_RULES:
+        # Rules no coarser than the bars, or clearly too fine, are skipped unevaluated
+        if length <= step or len(data) * (step / length) > max_rows * 4:
+            continue
+        frame = ohlc_resample(data, rule)
+        if len(frame) <= max_rows:
+            break
+    return frame
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: positions of threshold points that keep
+    # the visual shape of the (x, y) line. First and last points are kept.
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def lttb_frame(frame, max_points):
+    # Rows of an indicator frame for line charts: the union of the LTTB
+    # selections of every column, so each plotted line keeps its shape.
+    if len(frame) <= max_points:
+        return frame
+    if isinstance(frame.index, pd.DatetimeIndex):
+        x = frame.index.asi8.astype("float64")
+    else:
+        x = np.arange(len(frame), dtype="float64")
+    per_column = max(max_points // max(len(frame.columns), 1), 3)
+    keep = []
+    for column in frame.columns:
+        values = frame[column].to_numpy(dtype="float64", na_value=np.nan)
+        positions = np.flatnonzero(~np.isnan(values))
+        if len(positions):
+            keep.append(positions[lttb_indices(x[positions], values[positions], per_column)])
+    if not keep:
+        return frame
+    return frame.iloc[np.unique(np.concatenate(keep))]
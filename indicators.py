@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+BENCHMARK_TICKER = "^GSPC"
+TRADING_DAYS = 252
+SMA_WINDOWS = (20, 50, 200)
+EMA_WINDOWS = (12, 26)
+VOLATILITY_WINDOW = 20
+RSI_PERIOD = 14
+PIVOT_WINDOW = 5
+LEVEL_COUNT = 3
+
+
+def close_series(data):
+    # yf.download returns (Price, Ticker) columns even for a single ticker.
+    close = data['Close']
+    if isinstance(close, pd.DataFrame):
+        close = close.iloc[:, 0]
+    return close.dropna().astype(float)
+
+
+def _rsi(close, period=RSI_PERIOD):
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
+    rs = gain / loss.replace(0, np.nan)
+    rsi = 100 - 100 / (1 + rs)
+    return rsi.where(loss != 0, 100.0)
+
+
+def _levels(close, window=PIVOT_WINDOW, count=LEVEL_COUNT):
+    # Pivot lows/highs are closes that are the min/max of a centred window.
+    span = 2 * window + 1
+    lows = close[close == close.rolling(span, center=True).min()]
+    highs = close[close == close.rolling(span, center=True).max()]
+    last = close.iloc[-1]
+    support = np.sort(np.unique(lows[lows < last].round(2).to_numpy()))[::-1][:count]
+    resistance = np.sort(np.unique(highs[highs > last].round(2).to_numpy()))[:count]
+    return support.tolist(), resistance.tolist()
+
+
+def compute_indicators(data, benchmark=None):
+    # Computes every technical indicator from the yf.download frame in one
+    # vectorized pass. Returns {"frame": per-day indicators, "summary": latest
+    # and aggregate values} or None when there are fewer than two closes.
+    close = close_series(data)
+    if len(close) < 2:
+        return None
+    returns = close.pct_change()
+
+    frame = pd.DataFrame({"Close": close})
+    for window in SMA_WINDOWS:
+        frame[f"SMA_{window}"] = close.rolling(window, min_periods=window).mean()
+    for window in EMA_WINDOWS:
+        frame[f"EMA_{window}"] = close.ewm(span=window, adjust=False).mean()
+    frame["Volatility_20d"] = returns.rolling(VOLATILITY_WINDOW).std() * np.sqrt(TRADING_DAYS)
+    frame["RSI_14"] = _rsi(close)
+    frame["MACD"] = frame["EMA_12"] - frame["EMA_26"]
+    frame["MACD_Signal"] = frame["MACD"].ewm(span=9, adjust=False).mean()
+    frame["MACD_Hist"] = frame["MACD"] - frame["MACD_Signal"]
+    frame["Drawdown"] = close / close.cummax() - 1
+
+    start_price = float(close.iloc[0])
+    end_price = float(close.iloc[-1])
+    latest = frame.iloc[-1]
+    summary = {
+        "start_price": start_price,
+        "end_price": end_price,
+        "change_pct": (end_price - start_price) / start_price * 100,
+        "std_dev": float(close.std()),
+        "annualized_volatility_pct": float(returns.std() * np.sqrt(TRADING_DAYS) * 100),
+        "rolling_volatility_pct": float(latest["Volatility_20d"] * 100),
+        "rsi": float(latest["RSI_14"]),
+        "macd": float(latest["MACD"]),
+        "macd_signal": float(latest["MACD_Signal"]),
+        "max_drawdown_pct": float(frame["Drawdown"].min() * 100),
+    }
+    for window in SMA_WINDOWS:
+        summary[f"sma_{window}"] = float(latest[f"SMA_{window}"])
+    for window in EMA_WINDOWS:
+        summary[f"ema_{window}"] = float(latest[f"EMA_{window}"])
+
+    summary["beta"] = np.nan
+    summary["correlation"] = np.nan
+    if benchmark is not None and not benchmark.empty:
+        bench_returns = close_series(benchmark).pct_change()
+        aligned = pd.concat([returns, bench_returns], axis=1, join="inner").dropna()
+        if len(aligned) > 2:
+            cov = np.cov(aligned.to_numpy().T)
+            summary["beta"] = float(cov[0, 1] / cov[1, 1]) if cov[1, 1] else np.nan
+            summary["correlation"] = float(aligned.iloc[:, 0].corr(aligned.iloc[:, 1]))
+
+    summary["support"], summary["resistance"] = _levels(close)
+    return {"frame": frame, "summary": summary}
+
+
+def _fmt(value, suffix=""):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "n/a"
+    return f"{value:.2f}{suffix}"
+
+
+def metrics_table(summary, benchmark_ticker=BENCHMARK_TICKER):
+    rows = [
+        ("Start Price", _fmt(summary["start_price"], " USD")),
+        ("End Price", _fmt(summary["end_price"], " USD")),
+        ("Change", _fmt(summary["change_pct"], "%")),
+        ("Volatility (std dev)", _fmt(summary["std_dev"])),
+        ("Annualized Volatility", _fmt(summary["annualized_volatility_pct"], "%")),
+        (f"Rolling Volatility ({VOLATILITY_WINDOW}d, annualized)", _fmt(summary["rolling_volatility_pct"], "%")),
+    ]
+    rows += [(f"SMA {w}", _fmt(summary[f"sma_{w}"])) for w in SMA_WINDOWS]
+    rows += [(f"EMA {w}", _fmt(summary[f"ema_{w}"])) for w in EMA_WINDOWS]
+    rows += [
+        (f"RSI ({RSI_PERIOD})", _fmt(summary["rsi"])),
+        ("MACD / Signal", f"{_fmt(summary['macd'])} / {_fmt(summary['macd_signal'])}"),
+        ("Max Drawdown", _fmt(summary["max_drawdown_pct"], "%")),
+        (f"Beta vs {benchmark_ticker}", _fmt(summary["beta"])),
+        (f"Correlation vs {benchmark_ticker}", _fmt(summary["correlation"])),
+        ("Support Levels", ", ".join(_fmt(v) for v in summary["support"]) or "n/a"),
+        ("Resistance Levels", ", ".join(_fmt(v) for v in summary["resistance"]) or "n/a"),
+    ]
+    lines = ["| Metric | Value |", "| --- | --- |"]
+    lines += [f"| {name} | {value} |" for name, value in rows]
+    return "\n".join(lines)
@@ -0,0 +1,213 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import artifacts
+import chartrender
+import pipeline
+import tracing
+from tickerresolver import normalize_name, resolve_ticker, resolve_tickers, ticker_cache
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", 3600))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, key, stages):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.stages = list(stages)
+        self.status = QUEUED
+        self.stage = None
+        self.stage_times = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        self.output_text = ""
+        self.output_charts = []
+        self.trace = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def progress(self):
+        if self.status == DONE:
+            return 1.0
+        if self.stage not in self.stages:
+            return 0.0
+        return self.stages.index(self.stage) / len(self.stages)
+
+    def on_output(self, kind, value):
+        # Collects streamed agent output so the UI can show it while running.
+        if kind == "text":
+            self.output_text += value
+        elif kind == "chart":
+            self.output_charts.append(value)
+
+    def enter_stage(self, stage):
+        # Called by the pipeline at each stage boundary; also the point where
+        # a cancellation request takes effect.
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.stage = stage
+        self.stage_times[stage] = time.time()
+
+
+class JobManager:
+    # Runs report jobs on a process-wide worker pool so they outlive Streamlit
+    # reruns. Jobs with the same key share one run while it is in flight.
+    def __init__(self, max_workers=JOB_WORKERS, retention=JOB_RETENTION):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._inflight = {}
+        self.retention = retention
+
+    def submit(self, kind, key, fn, *args, stages=(), **kwargs):
+        # fn receives the Job as its first argument.
+        with self._lock:
+            self._purge()
+            job_id = self._inflight.get((kind, key))
+            if job_id is not None:
+                return job_id
+            job = Job(kind, key, stages)
+            self._jobs[job.id] = job
+            self._inflight[(kind, key)] = job.id
+            job.future = self._pool.submit(self._run, job, fn, args, kwargs)
+            return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancel_requested:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        try:
+            with tracing.span(f"job.{job.kind}", job_id=job.id) as span:
+                job.trace = span
+                job.result = fn(job, *args, **kwargs)
+            # A cancel that arrived after the last stage boundary still wins
+            self._finish(job, CANCELLED if job.cancel_requested else DONE)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, FAILED)
+
+    def _finish(self, job, status):
+        with self._lock:
+            job.status = status
+            job.finished = time.time()
+            if self._inflight.get((job.kind, job.key)) == job.id:
+                del self._inflight[(job.kind, job.key)]
+
+    def _purge(self):
+        cutoff = time.time() - self.retention
+        for job_id in [j for j, job in self._jobs.items() if job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job._cancel.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, CANCELLED)
+        else:
+            # A running job stops at its next stage boundary; a later identical
+            # submit starts a fresh run rather than joining the cancelled one.
+            with self._lock:
+                if self._inflight.get((job.kind, job.key)) == job.id:
+                    del self._inflight[(job.kind, job.key)]
+        return True
+
+
+job_manager = JobManager()
+
+
+# --- Report jobs ---
+
+
+def _report_job(job, company_or_ticker, start_date, end_date, peers=(), force_refresh=False, interval=pipeline.REPORT_INTERVAL):
+    job.enter_stage("resolve")
+    ticker = resolve_ticker(company_or_ticker)
+    if not ticker:
+        raise pipeline.ReportError(
+            "Could not resolve a valid ticker symbol for your input. Please check the company name or ticker."
+        )
+    # Unresolvable peers are skipped rather than failing the report
+    peer_tickers = [t for t in resolve_tickers(peers).values() if t and t != ticker] if peers else []
+    # Each job writes into its own artifact namespace; sessions link the
+    # finished files into theirs.
+    output_dir = artifacts.artifact_store.namespace(f"job-{job.id}")
+    return pipeline.cached_report(
+        ticker, start_date, end_date, output_dir=output_dir, force_refresh=force_refresh, progress=job.enter_stage,
+        on_output=job.on_output, peers=list(dict.fromkeys(peer_tickers)), interval=interval
+    )
+
+
+def submit_report(company_or_ticker, start_date, end_date, peers=(), force_refresh=False, interval=pipeline.REPORT_INTERVAL):
+    # Dedup key is the resolved ticker when it is already cached, otherwise
+    # the normalized input, so "msft" and "MSFT" share one run. A forced
+    # refresh never joins a run that may be served from the report cache.
+    chartrender.warm_up()
+    name = normalize_name(company_or_ticker)
+    hit, ticker = ticker_cache.lookup(name)
+    peer_key = tuple(sorted(normalize_name(p) for p in peers))
+    key = ((ticker if hit and ticker else name), str(start_date), str(end_date), peer_key, force_refresh, interval)
+    return job_manager.submit(
+        "report", key, _report_job, company_or_ticker, start_date, end_date, list(peers), force_refresh, interval,
+        stages=pipeline.STAGES
+    )
+
+
+def _comprehensive_job(job, report, csv_filename):
+    # Works on a private copy of the report in the job's own namespace, so
+    # every session sharing the job adopts the result like a report job's.
+    report = copy.deepcopy(report)
+    output_dir = artifacts.artifact_store.namespace(f"job-{job.id}")
+    csv_filename = artifacts.artifact_store.adopt(f"job-{job.id}", csv_filename)
+    pdf_name = report.pdf_filename or f"{report.ticker}_{report.start_date}_to_{report.end_date}_analysis.pdf"
+    report.pdf_filename = os.path.join(output_dir, os.path.basename(pdf_name))
+    comp_analysis, cmpr_pdf_filename = pipeline.comprehensive_due_diligence(
+        report, csv_filename, progress=job.enter_stage, on_output=job.on_output
+    )
+    return {"report": report, "analysis": comp_analysis, "pdf_filename": cmpr_pdf_filename, "csv_filename": csv_filename}
+
+
+def comprehensive_key(report):
+    # Sessions holding the same report content (e.g. both served from the
+    # report cache) share one comprehensive run.
+    digest = hashlib.sha256(report.to_text().encode("utf-8")).hexdigest()
+    return (report.ticker, report.start_date, report.end_date, digest)
+
+
+def submit_comprehensive(report, csv_filename):
+    key = comprehensive_key(report)
+    return job_manager.submit(
+        "comprehensive", key, _comprehensive_job, report, csv_filename, stages=("upload", "agent", "render")
+    )
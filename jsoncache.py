@@ -0,0 +1,57 @@
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+
+class JsonCache:
+    # Base for the small process-wide caches persisted as one JSON file
+    # (ticker resolutions, upload file ids). Entries are loaded once and
+    # written atomically; concurrent misses for the same key share a single
+    # computation.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _save(self):
+        # Callers hold self._lock.
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def _coalesce(self, key, compute):
+        # Returns (value, computed): the first caller for key runs compute(),
+        # concurrent callers wait for its result (or exception).
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            return future.result(), False
+        try:
+            value = compute()
+            future.set_result(value)
+            return value, True
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
@@ -0,0 +1,147 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import indicators
+import tracing
+from pricestore import get_price_matrix
+
+PEER_DRAWDOWN_WINDOW = int(os.getenv("PEER_DRAWDOWN_WINDOW", 63))
+PEER_TABLE_ROWS = int(os.getenv("PEER_TABLE_ROWS", 15))
+PEER_CORRELATION_COUNT = 3
+PEER_BASKET = "PEERS"
+
+
+def parse_peers(text):
+    # Comma, semicolon or newline separated names/tickers; order kept, duplicates dropped.
+    names = [n.strip() for n in re.split(r"[,;\n]+", text or "")]
+    return list(dict.fromkeys(n for n in names if n))
+
+
+def peer_analytics(closes, target=None, benchmark=indicators.BENCHMARK_TICKER):
+    # Cross-ticker analytics on an aligned (Date x ticker) close matrix, each
+    # metric computed for all columns at once. With a target, the other
+    # non-benchmark columns are also combined into an equal-weight basket.
+    # Returns None when there are fewer than two dates.
+    closes = closes.sort_index().dropna(how="all")
+    if len(closes) < 2:
+        return None
+    # Exchanges close on different days: carry a close forward only within
+    # each ticker's own history, never past its last bar.
+    closes = closes.ffill().where(closes.bfill().notna())
+    returns = closes.pct_change(fill_method=None)
+    peers = [c for c in closes.columns if c not in (target, benchmark)]
+    if target is not None and len(peers) > 1:
+        returns[PEER_BASKET] = returns[peers].mean(axis=1)
+    growth = (1 + returns.fillna(0)).cumprod()
+    growth = growth.where(closes.notna().reindex(columns=growth.columns, fill_value=True))
+
+    drawdown = growth / growth.cummax() - 1
+    rolling_drawdown = growth / growth.rolling(PEER_DRAWDOWN_WINDOW, min_periods=1).max() - 1
+    covariance = returns.cov()
+    correlation = returns.corr()
+    table = pd.DataFrame({
+        "total_return_pct": (growth.ffill().iloc[-1] - 1) * 100,
+        "volatility_pct": returns.std() * np.sqrt(indicators.TRADING_DAYS) * 100,
+        "max_drawdown_pct": drawdown.min() * 100,
+        "rolling_drawdown_pct": rolling_drawdown.ffill().iloc[-1] * 100,
+    })
+    table["return_per_risk"] = (
+        returns.mean() * indicators.TRADING_DAYS * 100 / table["volatility_pct"].replace(0, np.nan)
+    )
+    if benchmark in covariance.columns:
+        table["relative_pct"] = table["total_return_pct"] - table.loc[benchmark, "total_return_pct"]
+        table["beta"] = covariance[benchmark] / covariance.loc[benchmark, benchmark]
+    if target in correlation.columns:
+        table["correlation"] = correlation[target]
+    ranked = table.drop(index=[benchmark, PEER_BASKET], errors="ignore")
+    table["rank"] = ranked["total_return_pct"].rank(ascending=False, method="min")
+    table["risk_rank"] = ranked["volatility_pct"].rank(method="min")
+    table.index.name = "Ticker"
+    return {
+        "table": table,
+        "correlation": correlation,
+        "covariance": covariance,
+        "growth": growth,
+        "drawdown": rolling_drawdown,
+        "target": target,
+        "benchmark": benchmark,
+        "tickers": int(table["rank"].notna().sum()),
+    }
+
+
+def compare(tickers, start_date, end_date, target=None, benchmark=indicators.BENCHMARK_TICKER):
+    # Loads the whole peer group (plus the benchmark) as one price matrix and
+    # returns peer_analytics() for it.
+    tickers = list(dict.fromkeys([*([target] if target else []), *tickers, benchmark]))
+    with tracing.span("peers", tickers=len(tickers)) as span:
+        closes = get_price_matrix(tickers, start_date, end_date)
+        span.add(rows=len(closes), columns=len(closes.columns))
+        return peer_analytics(closes, target=target, benchmark=benchmark)
+
+
+def _fmt(value, suffix=""):
+    return indicators._fmt(None if pd.isna(value) else float(value), suffix)
+
+
+def peer_table(analytics, max_rows=PEER_TABLE_ROWS):
+    # Markdown ranking table. Large groups are cut to the top max_rows; the
+    # target, benchmark and peer basket rows are always kept.
+    table = analytics["table"].sort_values(["rank", "total_return_pct"], ascending=[True, False], na_position="last")
+    pinned = [analytics["target"], analytics["benchmark"], PEER_BASKET]
+    keep = table.index.isin(table.index[:max_rows]) | table.index.isin(pinned)
+    table = table[keep]
+    columns = [
+        ("Return", "total_return_pct", "%"),
+        (f"vs {analytics['benchmark']}", "relative_pct", "%"),
+        ("Volatility", "volatility_pct", "%"),
+        ("Return/Risk", "return_per_risk", ""),
+        ("Beta", "beta", ""),
+        (f"Corr vs {analytics['target']}", "correlation", ""),
+        ("Max Drawdown", "max_drawdown_pct", "%"),
+        (f"Drawdown ({PEER_DRAWDOWN_WINDOW}d)", "rolling_drawdown_pct", "%"),
+    ]
+    columns = [c for c in columns if c[1] in table.columns]
+    lines = [
+        "| Rank | Ticker | " + " | ".join(c[0] for c in columns) + " |",
+        "| --- | --- | " + " | ".join("---" for _ in columns) + " |",
+    ]
+    for ticker, row in table.iterrows():
+        rank = "-" if pd.isna(row["rank"]) else str(int(row["rank"]))
+        name = f"**{ticker}**" if ticker == analytics["target"] else ticker
+        values = " | ".join(_fmt(row[key], suffix) for _, key, suffix in columns)
+        lines.append(f"| {rank} | {name} | {values} |")
+    return "\n".join(lines)
+
+
+def peer_summary(analytics):
+    # Headline lines for the report: the target's rank and its most and least
+    # correlated peers.
+    table = analytics["table"]
+    target = analytics["target"]
+    lines = []
+    if target in table.index and not pd.isna(table.loc[target, "rank"]):
+        # No risk rank when the target's volatility could not be computed
+        risk_rank = table.loc[target, "risk_rank"]
+        risk_rank = "n/a" if pd.isna(risk_rank) else int(risk_rank)
+        lines.append(
+            f"**Return Rank:** {int(table.loc[target, 'rank'])} of {analytics['tickers']} "
+            f"(risk rank {risk_rank}, lowest volatility first)"
+        )
+    if "correlation" in table.columns:
+        others = table["correlation"].drop(index=[target, analytics["benchmark"], PEER_BASKET], errors="ignore").dropna()
+        if not others.empty:
+            ordered = others.sort_values(ascending=False)
+            fmt = lambda s: ", ".join(f"{t} ({v:.2f})" for t, v in s.items())
+            if len(ordered) <= 2 * PEER_CORRELATION_COUNT:
+                lines.append(f"**Peer Correlations:** {fmt(ordered)}")
+            else:
+                lines.append(f"**Most Correlated Peers:** {fmt(ordered.head(PEER_CORRELATION_COUNT))}")
+                lines.append(f"**Least Correlated Peers:** {fmt(ordered.tail(PEER_CORRELATION_COUNT)[::-1])}")
+    return lines
+
+
+def peer_section(analytics):
+    return ["## Peer Comparison"] + peer_summary(analytics) + peer_table(analytics).split("\n")
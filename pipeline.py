@@ -0,0 +1,561 @@
+import contextvars
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import agentpool
+import chartrender
+import contextbudget
+import downsample
+import duediligenceprompt as prompt
+import indicators
+import peergroup
+import reportcache
+import tracing
+import uploadcache
+from config import env_flag
+from pricestore import get_prices
+from report import Report
+
+STAGES = ("resolve", "download", "upload", "agent", "render")
+RETRY_ATTEMPTS = int(os.getenv("PIPELINE_RETRY_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.getenv("PIPELINE_RETRY_BASE_DELAY", 2.0))
+COMPREHENSIVE_FAN_OUT = env_flag("COMPREHENSIVE_FAN_OUT", True)
+SUBANALYSIS_TIMEOUT = float(os.getenv("SUBANALYSIS_TIMEOUT", 300))
+MERGE_TIMEOUT = float(os.getenv("MERGE_TIMEOUT", 180))
+UPLOAD_POLL_INTERVAL = float(os.getenv("UPLOAD_POLL_INTERVAL", 0.25))
+STREAM_AGENT_OUTPUT = env_flag("STREAM_AGENT_OUTPUT", True)
+# Bar interval of the price data (yfinance intervals: 1d, 1h, 5m, ...)
+REPORT_INTERVAL = os.getenv("REPORT_INTERVAL", "1d")
+
+
+class ReportError(Exception):
+    pass
+
+
+class StageLimiter:
+    # Bounds how many calls of a stage run at once and, optionally, how many
+    # may start per second across all threads.
+    def __init__(self, concurrency, rate=None):
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+        self._interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        if self._interval:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._next_start - now
+                self._next_start = max(now, self._next_start) + self._interval
+            if wait > 0:
+                time.sleep(wait)
+        return self
+
+    def __exit__(self, *exc):
+        self._semaphore.release()
+        return False
+
+
+# yfinance is shared by resolve and download; Azure calls are split between
+# cheap upload/list calls and long agent runs.
+stage_limits = {
+    "resolve": StageLimiter(4, rate=2.0),
+    "download": StageLimiter(4, rate=2.0),
+    "upload": StageLimiter(4, rate=4.0),
+    "agent": StageLimiter(8, rate=2.0),
+    "render": StageLimiter(os.cpu_count() or 2),
+}
+
+
+def configure_limits(concurrency=None, rates=None):
+    for stage, limit in (concurrency or {}).items():
+        rate = (rates or {}).get(stage)
+        stage_limits[stage] = StageLimiter(limit, rate=rate)
+
+
+def run_stage(stage, fn, *args, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, retry_if=None, **kwargs):
+    # Runs fn under the stage's limiter and retries with exponential backoff.
+    # ReportError is a definitive answer and is never retried, nor is any
+    # failure once retry_if() returns False. The stage span records attempts
+    # and the time spent waiting on the limiter.
+    with tracing.span(stage) as span:
+        for attempt in range(attempts):
+            span.add(attempts=1)
+            try:
+                queued = time.perf_counter()
+                with stage_limits[stage]:
+                    span.add(queued=round(time.perf_counter() - queued, 3))
+                    return fn(*args, **kwargs)
+            except ReportError:
+                raise
+            except Exception:
+                if attempt == attempts - 1 or (retry_if is not None and not retry_if()):
+                    raise
+                time.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+
+
+def _output_path(output_dir, filename):
+    return os.path.join(output_dir, filename) if output_dir else filename
+
+
+def save_charts(messages, output_dir=""):
+    # Downloads every image the agent produced, concurrently when there are
+    # several, and returns their paths in message order.
+    file_ids = [c.image_file.file_id for c in getattr(messages, "image_contents", None) or []]
+    if len(file_ids) <= 1:
+        return [save_chart(file_id, output_dir) for file_id in file_ids]
+    with ThreadPoolExecutor(max_workers=min(len(file_ids), 4), thread_name_prefix="save-chart") as pool:
+        return list(pool.map(
+            lambda file_id, ctx: ctx.run(save_chart, file_id, output_dir),
+            file_ids, [contextvars.copy_context() for _ in file_ids]
+        ))
+
+
+def save_chart(file_id, output_dir=""):
+    chart_img = f"{file_id}_image_file.png"
+    with tracing.span("save_file") as span:
+        agentpool.get_project_client().agents.save_file(file_id=file_id, file_name=chart_img, target_dir=output_dir or None)
+        span.add(bytes_received=tracing.file_bytes(_output_path(output_dir, chart_img)))
+    return _output_path(output_dir, chart_img)
+
+
+def stream_into_report(report, section, role, content, output_dir="", on_output=None, **run_kwargs):
+    # Consumes a streaming agent run. Completed lines are appended to the
+    # report section and laid out on the PDF draft straight away, charts are
+    # downloaded as soon as they appear, and on_output(kind, value) receives
+    # every text delta and chart path for progressive display.
+    def emit(kind, value):
+        if on_output:
+            on_output(kind, value)
+
+    thread_id = None
+    messages, current, pending = [], "", ""
+    try:
+        for kind, value in agentpool.stream_agent(role, content, **run_kwargs):
+            if kind == "thread":
+                thread_id = value
+            elif kind == "text":
+                if not current and messages:
+                    # Separate consecutive assistant messages like the batch path does
+                    report.extend_section(section, [""])
+                    emit("text", "\n\n")
+                current += value
+                pending += value
+                emit("text", value)
+                if "\n" in pending:
+                    complete, _, pending = pending.rpartition("\n")
+                    report.extend_section(section, complete.split("\n"))
+                    report.layout()
+            elif kind == "image":
+                chart_img = save_chart(value, output_dir)
+                # Emitted before the report changes so callers can tell
+                # whether a failed run left anything behind
+                emit("chart", chart_img)
+                report.extend_section(section, charts=[chart_img])
+                report.layout()
+            elif kind == "message_done":
+                if pending:
+                    report.extend_section(section, [pending])
+                    report.layout()
+                if current:
+                    messages.append(current)
+                current, pending = "", ""
+        if pending:
+            report.extend_section(section, [pending])
+        if current:
+            messages.append(current)
+    finally:
+        if thread_id:
+            agentpool.delete_thread(thread_id)
+    return "\n\n".join(messages)
+
+
+def _upload_payload(content, filename):
+    from azure.ai.projects.models import FilePurpose
+    with tracing.span("upload_file_and_poll", bytes_sent=len(content)):
+        return agentpool.get_project_client().agents.upload_file_and_poll(
+            file=(filename, content), purpose=FilePurpose.AGENTS, filename=filename,
+            sleep_interval=UPLOAD_POLL_INTERVAL
+        ).id
+
+
+def upload_file(csv_filename):
+    # Uploads the CSV payload once per distinct content and returns
+    # (file_id, upload filename); repeat uploads reuse the cached file id.
+    agents = agentpool.get_project_client().agents
+    uploadcache.upload_cache.cleanup(agents.delete_file)
+    content, filename = uploadcache.read_payload(csv_filename)
+    file_id, reused = uploadcache.upload_cache.get_or_upload(
+        content, filename, _upload_payload, project=agentpool.AZUREML_CONN_STR or ""
+    )
+    tracing.add(reused=reused, payload_bytes=len(content))
+    return file_id, filename
+
+
+@contextmanager
+def uploaded_file(file_id):
+    # Agent errors about a missing or expired upload name its file id; the
+    # cached entry is dropped so the next report uploads the payload again.
+    try:
+        yield file_id
+    except Exception as e:
+        if file_id in str(e):
+            uploadcache.upload_cache.invalidate(file_id)
+        raise
+
+
+def basic_analysis(ticker, start_date, end_date, data, interval="1d"):
+    analysis = []
+    analysis.append(f"**Ticker:** {ticker}")
+    analysis.append(f"**Period:** {start_date} to {end_date}")
+    if downsample.is_intraday(interval):
+        # Indicators are defined on daily bars; daily OHLCV aggregated from
+        # the full-resolution intraday bars keeps them exact.
+        analysis.append(f"**Interval:** {interval} ({len(data)} bars)")
+        data = downsample.ohlc_resample(data, "1D")
+    # Closes missing from the download (NaN) do not count
+    if len(indicators.close_series(data)) < 2:
+        analysis.append("Not enough data to generate analysis for the selected period.")
+        return analysis, None
+    try:
+        benchmark = run_stage("download", get_prices, indicators.BENCHMARK_TICKER, start_date, end_date)
+    except Exception:
+        benchmark = None
+    try:
+        metrics = indicators.compute_indicators(data, benchmark)
+        summary = metrics["summary"]
+        analysis.append(f"**Start Price:** {summary['start_price']:.2f} USD")
+        analysis.append(f"**End Price:** {summary['end_price']:.2f} USD")
+        analysis.append(f"**Change:** {summary['change_pct']:.2f}%")
+        analysis.append(f"**Volatility (std dev):** {summary['std_dev']:.2f}")
+        # Rendered once and reused for the report tables and the prompt
+        metrics["table"] = indicators.metrics_table(summary)
+        analysis.append("## Technical Indicators")
+        analysis.extend(metrics["table"].split("\n"))
+    except Exception as e:
+        metrics = None
+        analysis.append("Error calculating analysis: " + str(e))
+    return analysis, metrics
+
+
+def render_pdf(report, pdf_filename):
+    report.write_pdf(pdf_filename)
+    tracing.add(pdf_bytes=tracing.file_bytes(pdf_filename))
+    return pdf_filename
+
+
+def verdict(text):
+    # Best-effort reading of the pass/fail conclusion the prompts ask for.
+    found = re.findall(r"\b(passed|failed|pass|fail)\b", text.lower())
+    if not found:
+        return "unknown"
+    return "passed" if found[-1].startswith("pass") else "failed"
+
+
+def peer_comparison(ticker, peers, start_date, end_date):
+    # Best effort: a failed peer download leaves the report without the section.
+    try:
+        return run_stage("download", peergroup.compare, peers, start_date, end_date, target=ticker)
+    except Exception:
+        return None
+
+
+def generate_report(ticker, start_date, end_date, output_dir="", progress=None, on_output=None, stream=STREAM_AGENT_OUTPUT, peers=(), interval=REPORT_INTERVAL):
+    # Download, upload, agent run and PDF for an already resolved ticker.
+    # progress, if given, is called with each stage name as it starts;
+    # on_output receives streamed agent text and charts (see stream_into_report).
+    # peers, resolved tickers, add a peer comparison section.
+    with tracing.span("generate_report", ticker=ticker, stream=stream, interval=interval), chartrender.charts_in_use():
+        return _generate_report(ticker, start_date, end_date, output_dir, progress, on_output, stream, peers, interval)
+
+
+def cached_report(ticker, start_date, end_date, output_dir="", force_refresh=False, peers=(), interval=REPORT_INTERVAL, **kwargs):
+    # generate_report behind the report cache. A fresh hit is returned as is,
+    # a stale hit is returned and regenerated in the background, and
+    # force_refresh always regenerates. Cached results carry "cached": True.
+    if not reportcache.REPORT_CACHE:
+        return generate_report(ticker, start_date, end_date, output_dir=output_dir, peers=peers, interval=interval, **kwargs)
+    cache = reportcache.report_cache
+    key = reportcache.report_key(ticker, start_date, end_date, peers, interval)
+    if not force_refresh:
+        with tracing.span("report_cache.lookup", ticker=ticker) as span:
+            result = cache.lookup(key, output_dir)
+            span.add(hit=result is not None, stale=bool(result and result["stale"]))
+        if result is not None:
+            if result["stale"]:
+                cache.refresh(key, lambda work_dir: generate_report(
+                    ticker, start_date, end_date, output_dir=work_dir, stream=False, peers=peers, interval=interval
+                ))
+            return result
+    result = generate_report(ticker, start_date, end_date, output_dir=output_dir, peers=peers, interval=interval, **kwargs)
+    try:
+        cache.store(key, result)
+    except Exception:
+        pass
+    return result
+
+
+def _generate_report(ticker, start_date, end_date, output_dir, progress, on_output, stream, peers, interval):
+    def stage(name):
+        if progress:
+            progress(name)
+
+    stage("download")
+    data = run_stage("download", get_prices, ticker, start_date, end_date, interval=interval)
+    if data.empty:
+        raise ReportError(f"No data found for ticker: {ticker} in the given date range.")
+    analysis, metrics = basic_analysis(ticker, start_date, end_date, data, interval)
+    peer_analysis = peer_comparison(ticker, peers, start_date, end_date) if peers else None
+    # Local charts render in worker processes while the upload and agent run;
+    # each one is passed to on_output as soon as it is ready.
+    chart_futures = []
+    if chartrender.LOCAL_CHARTS and metrics:
+        chart_futures = chartrender.submit_charts(ticker, start_date, end_date, metrics["frame"])
+        if on_output:
+            for future in chart_futures:
+                future.add_done_callback(
+                    lambda f: on_output("chart", f.result()) if not f.cancelled() and f.exception() is None else None
+                )
+
+    csv_filename = _output_path(output_dir, f"{ticker}_{start_date}_to_{end_date}.csv")
+    payload_rows = uploadcache.write_payload_csv(data, csv_filename)
+    # Memory held for this report's price data and what is sent on
+    sizes = {
+        "interval": interval,
+        "rows": len(data),
+        "data_bytes": int(data.memory_usage(deep=True).sum()),
+        "indicator_bytes": int(metrics["frame"].memory_usage(deep=True).sum()) if metrics else 0,
+        "payload_rows": payload_rows,
+        "payload_bytes": tracing.file_bytes(csv_filename),
+    }
+    tracing.add(**sizes)
+
+    stage("upload")
+    file_id, upload_name = run_stage("upload", upload_file, csv_filename)
+
+    report = Report(ticker, start_date, end_date)
+    report.add_section("basic", analysis)
+    if metrics:
+        report.metrics = metrics["summary"]
+        report.tables["Technical Indicators"] = metrics["table"]
+    peer_context = ""
+    if peer_analysis:
+        report.add_section("peers", peergroup.peer_section(peer_analysis))
+        report.tables["Peer Comparison"] = peergroup.peer_table(peer_analysis)
+        peer_context = prompt.peer_comparison.format(peers=peer_analysis["tickers"]) + report.tables["Peer Comparison"]
+    content = f"Could you please create chart of the stock mentioned {ticker} from {start_date} to {end_date}?"
+    additional_instructions = contextbudget.fit([
+        ("", f"Use file {upload_name} having {file_id} to get more data.", False),
+        ("", prompt.precomputed_metrics + metrics["table"] if metrics else "", False),
+        ("", peer_context, False),
+    ])
+
+    stage("agent")
+    if stream:
+        # Lay out the local analysis while the agent is still generating
+        report.layout()
+        emitted = []
+
+        def agent_output(kind, value):
+            emitted.append(kind)
+            if on_output:
+                on_output(kind, value)
+
+        # A failed run is retried until its output has started to appear
+        with uploaded_file(file_id):
+            agent_analysis = run_stage(
+                "agent", stream_into_report, report, "agent", "due diligince agent", content,
+                output_dir=output_dir, on_output=agent_output, file_ids=[file_id],
+                additional_instructions=additional_instructions, retry_if=lambda: not emitted
+            )
+    else:
+        with uploaded_file(file_id):
+            thread_id, messages = run_stage(
+                "agent",
+                agentpool.run_agent,
+                "due diligince agent",
+                content,
+                file_ids=[file_id],
+                additional_instructions=additional_instructions
+            )
+        try:
+            agent_analysis = "\n\n".join(agentpool.assistant_texts(messages))
+            agent_charts = save_charts(messages, output_dir)
+        finally:
+            agentpool.delete_thread(thread_id)
+        report.add_section("agent", agent_analysis, charts=agent_charts)
+
+    local_charts = chartrender.collect_charts(chart_futures) if chart_futures else []
+    if local_charts:
+        report.add_section("charts", [], charts=local_charts)
+
+    stage("render")
+    pdf_filename = _output_path(output_dir, f"{ticker}_{start_date}_to_{end_date}_analysis.pdf")
+    run_stage("render", render_pdf, report, pdf_filename, attempts=1)
+    if local_charts:
+        chartrender.prune_cache()
+    return {
+        "ticker": ticker,
+        "start_date": str(start_date),
+        "end_date": str(end_date),
+        "csv_filename": csv_filename,
+        "pdf_filename": pdf_filename,
+        "report": report,
+        "final_analysis": report.to_text(),
+        "charts": report.charts,
+        "metrics": report.metrics or None,
+        "peers": peer_analysis["table"] if peer_analysis else None,
+        "verdict": verdict(agent_analysis),
+        "sizes": sizes,
+    }
+
+
+def _subanalysis(name, instructions, content, file_id, context, output_dir):
+    with tracing.span("subanalysis", analysis=name), uploaded_file(file_id):
+        thread_id, messages = run_stage(
+            "agent",
+            agentpool.run_agent,
+            "comprehensive-agent",
+            content,
+            file_ids=[file_id],
+            instructions=instructions,
+            additional_instructions=context,
+            timeout=SUBANALYSIS_TIMEOUT,
+            attempts=1
+        )
+        try:
+            return "\n\n".join(agentpool.assistant_texts(messages)), save_charts(messages, output_dir)
+        finally:
+            agentpool.delete_thread(thread_id)
+
+
+def prior_context(report):
+    # The report so far as prompt parts for later runs: its metric tables as
+    # they are and its free-text analysis as a budgeted summary.
+    tables = "\n\n".join(f"{name}:\n{table}" for name, table in report.tables.items())
+    analysis = "\n\n".join(
+        "\n".join(section["lines"]) for section in report.sections
+        if section["lines"] and section["name"] not in ("basic", "peers", "charts")
+    )
+    return [("Key metrics", tables, False), ("Previous analysis", analysis, True)]
+
+
+def fan_out_analysis(report, file_id, csv_basename, output_dir="", on_output=None):
+    # Runs each focused sub-analysis as its own agent run in parallel, then a
+    # merge run that draws the pass/fail conclusion. Sub-analyses that fail or
+    # exceed SUBANALYSIS_TIMEOUT are reported as missing instead of failing the
+    # whole step, so wall-clock time is bounded by the slowest one. Each
+    # finished sub-analysis is passed to on_output as soon as it completes.
+    ticker, start_date, end_date = report.ticker, report.start_date, report.end_date
+    context = f"Company: {ticker}\nPeriod: {start_date} to {end_date}\nUse the uploaded file {csv_basename} for price data.\n"
+    if report.tables.get("Technical Indicators"):
+        context += "Technical indicators for the period:\n" + report.tables["Technical Indicators"]
+    content = f"Analyse {ticker} for the period {start_date} to {end_date}."
+    subanalyses = prompt.comprehensive_subanalyses
+    pool = ThreadPoolExecutor(max_workers=len(subanalyses), thread_name_prefix="subanalysis")
+    # Each worker runs in a copy of this context so its spans join the trace
+    futures = {
+        name: pool.submit(
+            contextvars.copy_context().run, _subanalysis, name, instructions, content, file_id, context, output_dir
+        )
+        for name, instructions in subanalyses.items()
+    }
+    if on_output:
+        def emit(name, future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            text, section_charts = future.result()
+            on_output("text", f"## {name}\n{text}\n\n")
+            for chart_img in section_charts:
+                on_output("chart", chart_img)
+
+        for name, future in futures.items():
+            future.add_done_callback(lambda f, name=name: emit(name, f))
+    wait(futures.values(), timeout=SUBANALYSIS_TIMEOUT + 30)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    sections, charts = [], []
+    for name, future in futures.items():
+        if not future.done():
+            text = f"This analysis did not finish within {SUBANALYSIS_TIMEOUT:.0f}s and is not included."
+        elif future.exception() is not None:
+            text = f"This analysis could not be completed: {future.exception()}"
+        else:
+            text, section_charts = future.result()
+            charts.extend(section_charts)
+        sections.append(f"## {name}\n{text}")
+    findings = "\n\n".join(sections)
+
+    try:
+        thread_id, messages = run_stage(
+            "agent",
+            agentpool.run_agent,
+            "comprehensive-merge",
+            f"Conclude the due diligence for {ticker} from {start_date} to {end_date}.",
+            additional_instructions=contextbudget.fit(
+                prior_context(report) + [("Specialist findings", findings, True)]
+            ),
+            timeout=MERGE_TIMEOUT,
+            attempts=1
+        )
+        try:
+            conclusion = "\n\n".join(agentpool.assistant_texts(messages))
+        finally:
+            agentpool.delete_thread(thread_id)
+    except Exception as e:
+        conclusion = f"The merge step did not complete: {e}"
+    return f"{findings}\n\n## Overall Conclusion\n{conclusion}", charts
+
+
+def comprehensive_due_diligence(report, csv_filename, progress=None, on_output=None):
+    # Appends a comprehensive section to the report and writes it next to the
+    # previous PDF; the sections already laid out are not rendered again.
+    with tracing.span("comprehensive", ticker=report.ticker, fan_out=COMPREHENSIVE_FAN_OUT):
+        return _comprehensive_due_diligence(report, csv_filename, progress, on_output)
+
+
+def _comprehensive_due_diligence(report, csv_filename, progress, on_output):
+    def stage(name):
+        if progress:
+            progress(name)
+
+    ticker, start_date_str, end_date_str = report.ticker, report.start_date, report.end_date
+    stage("upload")
+    file_id, upload_name = run_stage("upload", upload_file, csv_filename)
+    prev_pdf_filename = report.pdf_filename or f"{ticker}_{start_date_str}_to_{end_date_str}_analysis.pdf"
+    output_dir = os.path.dirname(prev_pdf_filename)
+    stage("agent")
+    if COMPREHENSIVE_FAN_OUT:
+        comp_analysis, charts = fan_out_analysis(
+            report, file_id, upload_name, output_dir, on_output=on_output
+        )
+    else:
+        additional_instructions = contextbudget.fit([
+            ("", f"Company: {ticker}\nPeriod: {start_date_str} to {end_date_str}\n"
+                 f"Use the uploaded file {upload_name} for financial data.", False),
+        ] + prior_context(report))
+        with uploaded_file(file_id):
+            thread_id, messages = run_stage(
+                "agent",
+                agentpool.run_agent,
+                "comprehensive-agent",
+                f"Do a comprehensive due diligence for {ticker} from {start_date_str} to {end_date_str}.",
+                file_ids=[file_id],
+                additional_instructions=additional_instructions
+            )
+        try:
+            comp_analysis = "\n\n".join(agentpool.assistant_texts(messages))
+            charts = save_charts(messages, output_dir)
+        finally:
+            agentpool.delete_thread(thread_id)
+    report.add_section("comprehensive", ["---", ""] + comp_analysis.split('\n'), charts=charts)
+    cmpr_pdf_filename = _output_path(output_dir, f"cmprhsive_{os.path.basename(prev_pdf_filename)}")
+    stage("render")
+    run_stage("render", render_pdf, report, cmpr_pdf_filename, attempts=1)
+    return comp_analysis, cmpr_pdf_filename
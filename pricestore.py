@@ -0,0 +1,360 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay, USMartinLutherKingJr, USMemorialDay,
+    USPresidentsDay, USThanksgivingDay, nearest_workday, sunday_to_monday
+)
+from pandas.tseries.offsets import CustomBusinessDay
+
+import tracing
+from config import CACHE_DIR, env_flag
+
+PRICE_STORE_DIR = os.path.join(CACHE_DIR, "prices")
+PRICE_STORE_OFFLINE = env_flag("PRICE_STORE_OFFLINE")
+# Longest range fetched by one download. Long ranges are streamed into the
+# store chunk by chunk so only one chunk's raw download is held at a time;
+# Yahoo also rejects longer requests for intraday intervals.
+PRICE_CHUNK_DAYS = int(os.getenv("PRICE_CHUNK_DAYS", 3650))
+INTRADAY_CHUNK_DAYS = {"1m": 7, "2m": 59, "5m": 59, "15m": 59, "30m": 59, "60m": 365, "90m": 59, "1h": 365}
+# How far back Yahoo serves intraday bars; older ranges can never be filled
+INTRADAY_RETENTION_DAYS = {"1m": 30, "2m": 60, "5m": 60, "15m": 60, "30m": 60, "60m": 730, "90m": 60, "1h": 730}
+PRICE_STORE_MAX_PARTS = int(os.getenv("PRICE_STORE_MAX_PARTS", 8))
+PRICE_STORE_MEMORY_MAX = int(os.getenv("PRICE_STORE_MEMORY_MAX", 256 * 1024 * 1024))
+
+
+class ExchangeCalendar(AbstractHolidayCalendar):
+    # NYSE full-day holidays
+    rules = [
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+TRADING_DAY = CustomBusinessDay(calendar=ExchangeCalendar())
+
+
+def has_trading_days(start, end):
+    # Whether [start, end) contains an exchange trading day.
+    return len(pd.date_range(start, end - timedelta(days=1), freq=TRADING_DAY)) > 0
+
+
+def symbol(ticker):
+    # yfinance upper-cases symbols in its results, so the store does as well.
+    return ticker.strip().upper()
+
+
+def _day(value):
+    return pd.Timestamp(value).normalize().tz_localize(None)
+
+
+def flatten_download(data, ticker):
+    # yf.download returns (Price, Ticker) columns; the store keeps one ticker
+    # per file with plain OHLCV columns as float64 so slices share one block.
+    if data.columns.nlevels > 1:
+        tickers = data.columns.get_level_values(1)
+        data = data.xs(ticker, axis=1, level=1) if ticker in tickers else data.droplevel(1, axis=1)
+    data = data.astype("float64")
+    data.index = pd.DatetimeIndex(data.index)
+    if data.index.tz is not None:
+        data.index = data.index.tz_localize(None)
+    data.index.name = "Date"
+    data.columns.name = None
+    return data
+
+
+def yf_download(*args, **kwargs):
+    # yfinance is only imported once something is actually downloaded.
+    import yfinance as yf
+    return yf.download(*args, **kwargs)
+
+
+def _merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _chunks(ranges, interval):
+    # Splits [start, end) ranges into pieces no longer than one download.
+    span = timedelta(days=min(INTRADAY_CHUNK_DAYS.get(interval, PRICE_CHUNK_DAYS), PRICE_CHUNK_DAYS))
+    chunks = []
+    for start, end in ranges:
+        while start < end:
+            chunks.append((start, min(start + span, end)))
+            start += span
+    return chunks
+
+
+def _retention_start(interval):
+    # First day Yahoo still serves bars of interval for, None for daily and
+    # longer bars. The oldest retained day is left out so the first chunk
+    # never starts before the window.
+    days = INTRADAY_RETENTION_DAYS.get(interval)
+    if days is None:
+        return None
+    return _day(pd.Timestamp.today()) - timedelta(days=days - 1)
+
+
+def _gaps(intervals, start, end):
+    gaps = []
+    cursor = start
+    for have_start, have_end in intervals:
+        if have_end <= cursor:
+            continue
+        if have_start >= end:
+            break
+        if have_start > cursor:
+            gaps.append((cursor, min(have_start, end)))
+        cursor = max(cursor, have_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class PriceStore:
+    # Per ticker and interval: append-only Parquet parts, one per downloaded
+    # chunk, plus a JSON sidecar listing the parts and the [start, end) date
+    # ranges already fetched. Requests only download the missing gaps and
+    # read the parts overlapping the requested window. Once there are more
+    # than max_parts they are compacted into one file. Recently read parts
+    # are kept in memory up to memory_max bytes.
+    def __init__(self, root=PRICE_STORE_DIR, downloader=None, offline=PRICE_STORE_OFFLINE,
+                 max_parts=PRICE_STORE_MAX_PARTS, memory_max=PRICE_STORE_MEMORY_MAX):
+        self.root = root
+        self.downloader = downloader or yf_download
+        self.offline = offline
+        self.max_parts = max_parts
+        self.memory_max = memory_max
+        self._lock = threading.Lock()
+        self._ticker_locks = {}
+        self._meta = {}
+        self._parts = OrderedDict()
+        self._part_bytes = 0
+
+    def _base(self, ticker, interval):
+        return f"{symbol(ticker).replace('/', '_')}_{interval}"
+
+    def _ticker_lock(self, key):
+        with self._lock:
+            return self._ticker_locks.setdefault(key, threading.RLock())
+
+    def _load(self, ticker, interval):
+        key = (ticker, interval)
+        if key in self._meta:
+            return self._meta[key]
+        base = self._base(ticker, interval)
+        meta = {"ranges": [], "parts": [], "next": 0}
+        try:
+            with open(os.path.join(self.root, f"{base}.json"), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            meta["ranges"] = [[_day(s), _day(e)] for s, e in stored["ranges"]]
+            if "parts" in stored:
+                meta["parts"] = [[name, pd.Timestamp(first), pd.Timestamp(last)] for name, first, last in stored["parts"]]
+                meta["next"] = stored["next"]
+            elif os.path.exists(os.path.join(self.root, f"{base}.parquet")):
+                # Single file written by earlier versions; compacted away later
+                meta["parts"] = [[f"{base}.parquet", pd.Timestamp.min, pd.Timestamp.max]]
+        except (OSError, ValueError, KeyError):
+            meta = {"ranges": [], "parts": [], "next": 0}
+        self._meta[key] = meta
+        return meta
+
+    def _save_meta(self, ticker, interval):
+        meta = self._meta[(ticker, interval)]
+        meta_path = os.path.join(self.root, f"{self._base(ticker, interval)}.json")
+        os.makedirs(self.root, exist_ok=True)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "ranges": [[s.isoformat(), e.isoformat()] for s, e in meta["ranges"]],
+                "parts": [[name, first.isoformat(), last.isoformat()] for name, first, last in meta["parts"]],
+                "next": meta["next"],
+            }, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def _part(self, name):
+        with self._lock:
+            cached = self._parts.get(name)
+            if cached is not None:
+                self._parts.move_to_end(name)
+                return cached[0]
+        frame = pd.read_parquet(os.path.join(self.root, name))
+        size = int(frame.memory_usage(deep=True).sum())
+        if size <= self.memory_max:
+            with self._lock:
+                if name not in self._parts:
+                    self._parts[name] = (frame, size)
+                    self._part_bytes += size
+                while self._part_bytes > self.memory_max:
+                    _, (_, evicted) = self._parts.popitem(last=False)
+                    self._part_bytes -= evicted
+        return frame
+
+    def _forget(self, name):
+        with self._lock:
+            cached = self._parts.pop(name, None)
+            if cached is not None:
+                self._part_bytes -= cached[1]
+
+    def _read(self, ticker, interval, start, end):
+        # Rows in [start, end) from the parts overlapping it; where parts
+        # overlap, the most recently written row wins.
+        meta = self._meta[(ticker, interval)]
+        names = [name for name, first, last in meta["parts"] if last >= start and first < end]
+        if not names:
+            return pd.DataFrame()
+        frames = [self._part(name) for name in names]
+        if len(frames) == 1:
+            frame = frames[0]
+        else:
+            frame = pd.concat(frames)
+            frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+        return frame.loc[start:end - pd.Timedelta(microseconds=1)]
+
+    def _append(self, ticker, interval, fetched, covered):
+        # Writes a downloaded chunk as a new part and records its coverage.
+        meta = self._meta[(ticker, interval)]
+        if fetched is None and not covered:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        if fetched is not None:
+            name = f"{self._base(ticker, interval)}.{meta['next']:06d}.parquet"
+            fetched.to_parquet(os.path.join(self.root, name))
+            meta["parts"].append([name, fetched.index.min(), fetched.index.max()])
+            meta["next"] += 1
+        meta["ranges"] = _merge_intervals(meta["ranges"] + covered)
+        if len(meta["parts"]) > self.max_parts:
+            self._compact(ticker, interval)
+        else:
+            self._save_meta(ticker, interval)
+
+    def _compact(self, ticker, interval):
+        meta = self._meta[(ticker, interval)]
+        old = [name for name, _, _ in meta["parts"]]
+        frame = self._read(ticker, interval, pd.Timestamp.min, pd.Timestamp.max)
+        name = f"{self._base(ticker, interval)}.{meta['next']:06d}.parquet"
+        frame.to_parquet(os.path.join(self.root, name))
+        meta["parts"] = [[name, frame.index.min(), frame.index.max()]]
+        meta["next"] += 1
+        self._save_meta(ticker, interval)
+        for name in old:
+            self._forget(name)
+            try:
+                os.remove(os.path.join(self.root, name))
+            except OSError:
+                pass
+
+    def _expire(self, ticker, interval, gaps):
+        # Parts of gaps older than Yahoo's retention for interval are recorded
+        # as covered without data instead of being requested again on every
+        # call; the rest is returned for download.
+        retained = _retention_start(interval)
+        if retained is None:
+            return gaps
+        expired = [[start, min(end, retained)] for start, end in gaps if start < retained]
+        if expired:
+            self._append(ticker, interval, None, expired)
+        return [(max(start, retained), end) for start, end in gaps if end > retained]
+
+    def missing_ranges(self, ticker, start, end, interval="1d"):
+        ticker = symbol(ticker)
+        key = (ticker, interval)
+        with self._ticker_lock(key):
+            return _gaps(self._load(ticker, interval)["ranges"], _day(start), _day(end))
+
+    def get(self, ticker, start, end, interval="1d"):
+        # Same range semantics as yf.download: start inclusive, end exclusive.
+        ticker = symbol(ticker)
+        key = (ticker, interval)
+        start, end = _day(start), _day(end)
+        with self._ticker_lock(key):
+            meta = self._load(ticker, interval)
+            if not self.offline:
+                # Each chunk is stored as it arrives
+                gaps = self._expire(ticker, interval, _gaps(meta["ranges"], start, end))
+                for chunk in _chunks(gaps, interval):
+                    self._fill_chunk([ticker], interval, *chunk)
+            return self._read(ticker, interval, start, end)
+
+    def get_many(self, tickers, start, end, interval="1d", field="Close"):
+        # Aligned (Date x ticker) matrix of one price field. Tickers missing
+        # the same range share one bulk download per chunk of it; ranges
+        # already stored are never downloaded again. Columns are named as
+        # passed in; tickers without any data are left out.
+        start, end = _day(start), _day(end)
+        names = list(dict.fromkeys(tickers))
+        tickers = list(dict.fromkeys(symbol(name) for name in names))
+        if not self.offline:
+            missing = {}
+            for ticker in tickers:
+                with self._ticker_lock((ticker, interval)):
+                    gaps = self._expire(ticker, interval, _gaps(self._load(ticker, interval)["ranges"], start, end))
+                for gap in gaps:
+                    missing.setdefault(gap, []).append(ticker)
+            for gap, gap_tickers in sorted(missing.items()):
+                for chunk in _chunks([gap], interval):
+                    self._fill_chunk(gap_tickers, interval, *chunk)
+        series = {}
+        for ticker in tickers:
+            with self._ticker_lock((ticker, interval)):
+                self._load(ticker, interval)
+                frame = self._read(ticker, interval, start, end)
+            if field in frame.columns:
+                series[ticker] = frame[field]
+        columns = {name: series[symbol(name)] for name in names if symbol(name) in series}
+        matrix = pd.DataFrame(columns)
+        matrix.index.name = "Date"
+        return matrix
+
+    def _fill_chunk(self, tickers, interval, start, end):
+        with tracing.span("yf.download", tickers=len(tickers), start=str(start.date()), end=str(end.date())) as span:
+            data = self.downloader(
+                tickers if len(tickers) > 1 else tickers[0], start=start.date(), end=end.date(),
+                interval=interval, progress=False
+            )
+            if data is not None:
+                span.add(rows=len(data), bytes_received=int(data.memory_usage(deep=True).sum()))
+        available = set()
+        if data is not None and not data.empty:
+            available = set(data.columns.get_level_values(1)) if data.columns.nlevels > 1 else set(tickers)
+        # Today's bar is still moving, so it is never recorded as covered.
+        cover_end = min(end, _day(pd.Timestamp.today()))
+        for ticker in tickers:
+            # Rows of other tickers are NaN wherever this one has no bar
+            rows = flatten_download(data, ticker).dropna(how="all") if ticker in available else None
+            if rows is not None and rows.empty:
+                rows = None
+            if rows is None and has_trading_days(start, end):
+                # Empty although the exchange traded: throttled or failed, retried next call
+                continue
+            with self._ticker_lock((ticker, interval)):
+                self._load(ticker, interval)
+                self._append(ticker, interval, rows, [[start, cover_end]] if start < cover_end else [])
+
+price_store = PriceStore()
+
+
+def get_prices(ticker, start, end, interval="1d"):
+    return price_store.get(ticker, start, end, interval=interval)
+
+
+def get_price_matrix(tickers, start, end, interval="1d", field="Close"):
+    return price_store.get_many(tickers, start, end, interval=interval, field=field)
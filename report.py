@@ -0,0 +1,125 @@
+import copy
+import functools
+import os
+
+
+@functools.lru_cache(maxsize=4096)
+def safe_latin1(text):
+    replacements = {
+        '’': "'",
+        '‘': "'",
+        '“': '"',
+        '”': '"',
+        '–': '-',
+        '—': '-',
+        '•': '-',
+        '…': '...',
+    }
+    for k, v in replacements.items():
+        text = text.replace(k, v)
+    return text.encode('latin-1', 'ignore').decode('latin-1')
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_class():
+    # fpdf is imported when the first PDF is laid out, not at app start.
+    from fpdf import FPDF
+
+    class CustomFPDF(FPDF):
+        def multi_cell_bold(self, w, h, txt, align='L'):
+            # If line contains '##', make it bold, else normal
+            if "##" in txt:
+                self.set_font("Arial", 'B', 10)
+                self.multi_cell(w, h, txt.replace("##", "").strip(), align)
+                self.set_font("Arial", '', 10)
+            elif "**" in txt:
+                self.set_font("Arial", 'B', 8)
+                self.multi_cell(w, h, txt.replace("**", "").strip(), align)
+                self.set_font("Arial", '', 8)
+            else:
+                self.multi_cell(w, h, txt, align)
+
+    return CustomFPDF
+
+
+class Report:
+    # Single source of truth for a due diligence report. Sections hold the
+    # markdown lines and charts in report order; metrics and tables keep the
+    # structured values they were rendered from. The PDF is laid out
+    # incrementally: each line and chart is drawn once onto a draft document
+    # (as soon as layout() is called) and writing a file only finalizes a copy
+    # of that draft.
+    def __init__(self, ticker, start_date, end_date):
+        self.ticker = ticker
+        self.start_date = str(start_date)
+        self.end_date = str(end_date)
+        self.sections = []
+        self.metrics = {}
+        self.tables = {}
+        self.pdf_filename = None
+        self._draft = None
+        self._drawn = []
+
+    def add_section(self, name, lines, charts=None):
+        if isinstance(lines, str):
+            lines = lines.split('\n') if lines else []
+        section = {"name": name, "lines": list(lines), "charts": list(charts or [])}
+        self.sections.append(section)
+        return section
+
+    def extend_section(self, name, lines=(), charts=()):
+        # Appends to the named section (created if missing); used while agent
+        # output is still streaming in.
+        section = self.section(name) or self.add_section(name, [])
+        section["lines"].extend(lines)
+        section["charts"].extend(charts)
+        return section
+
+    def section(self, name):
+        for section in self.sections:
+            if section["name"] == name:
+                return section
+        return None
+
+    @property
+    def charts(self):
+        return [chart for section in self.sections for chart in section["charts"]]
+
+    def to_text(self):
+        return "\n\n".join("\n".join(section["lines"]) for section in self.sections if section["lines"])
+
+    def section_text(self, name):
+        section = self.section(name)
+        return "\n".join(section["lines"]) if section else ""
+
+    def layout(self):
+        # Draws whatever has been added since the last call onto the draft.
+        if self._draft is None:
+            self._draft = pdf_class()()
+            self._draft.add_page()
+            self._draft.set_font("Arial", size=10)
+        pdf = self._draft
+        page_width = pdf.w - 2 * pdf.l_margin
+        line_height = 6
+        for i, section in enumerate(self.sections):
+            if i == len(self._drawn):
+                self._drawn.append([0, 0])
+            lines_drawn, charts_drawn = self._drawn[i]
+            for line in section["lines"][lines_drawn:]:
+                pdf.multi_cell_bold(page_width, line_height, txt=safe_latin1(line), align='L')
+            for chart_img in section["charts"][charts_drawn:]:
+                if chart_img and os.path.exists(chart_img):
+                    # No explicit y: fpdf then breaks the page if needed and
+                    # moves below the image, so several charts do not overlap
+                    pdf.image(chart_img, x=10, w=page_width-20)
+            self._drawn[i] = [len(section["lines"]), len(section["charts"])]
+
+    def to_pdf_bytes(self):
+        self.layout()
+        return bytes(copy.deepcopy(self._draft).output())
+
+    def write_pdf(self, pdf_filename):
+        with open(pdf_filename, "wb") as f:
+            f.write(self.to_pdf_bytes())
+        self.pdf_filename = pdf_filename
+        return pdf_filename
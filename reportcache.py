@@ -0,0 +1,195 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import agentpool
+import duediligenceprompt as prompt
+import tracing
+from config import CACHE_DIR, env_flag
+from jsoncache import JsonCache
+from report import Report
+
+REPORT_CACHE_DIR = os.path.join(CACHE_DIR, "reports")
+REPORT_CACHE = env_flag("REPORT_CACHE", True)
+# Reports younger than REPORT_CACHE_TTL are served as is; older ones are still
+# served up to REPORT_CACHE_STALE_TTL but refreshed in the background.
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", 6 * 3600))
+REPORT_CACHE_STALE_TTL = float(os.getenv("REPORT_CACHE_STALE_TTL", 7 * 24 * 3600))
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+REPORT_REFRESH_WORKERS = int(os.getenv("REPORT_REFRESH_WORKERS", 2))
+
+
+def report_key(ticker, start_date, end_date, peers=(), interval="1d"):
+    # Prompt and model are part of the key so changing either invalidates
+    # every cached report.
+    prompt_hash = hashlib.sha256(prompt.instructions.encode("utf-8")).hexdigest()
+    parts = [ticker, str(start_date), str(end_date), sorted(peers), prompt_hash, agentpool.AGENT_MODEL]
+    if interval != "1d":
+        parts.append(interval)
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def _copy(path, target_dir):
+    target = os.path.join(target_dir, os.path.basename(path)) if target_dir else os.path.basename(path)
+    shutil.copyfile(path, target)
+    return target
+
+
+class ReportCache(JsonCache):
+    # Finished reports (report text, tables, charts, CSV and PDF) in one
+    # directory per key plus a JSON index. The index records creation time
+    # for freshness and last use for LRU eviction once the stored artifacts
+    # exceed max_bytes.
+    def __init__(self, root=REPORT_CACHE_DIR, ttl=REPORT_CACHE_TTL, stale_ttl=REPORT_CACHE_STALE_TTL, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self._refreshing = set()
+        self._pool = None
+        super().__init__(os.path.join(root, "index.json"))
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def lookup(self, key, output_dir=""):
+        # Returns a generate_report style result with the PDF, CSV and charts
+        # copied into output_dir, or None. "stale" marks results past the TTL.
+        # Last use is tracked in memory and written with the next change.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            age = time.time() - entry["created"]
+            if age > self.stale_ttl:
+                self._drop(key)
+                self._save()
+                return None
+            entry["used"] = time.time()
+        # Files are copied without the lock so other lookups and refreshes
+        # are not held up; if a store replaces the entry meanwhile, the copy
+        # fails and the lookup misses.
+        try:
+            result = self._restore(key, output_dir)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._drop(key)
+                    self._save()
+            return None
+        result["cached_at"] = entry["created"]
+        result["stale"] = age > self.ttl
+        return result
+
+    def _restore(self, key, output_dir):
+        entry_dir = os.path.join(self.root, key)
+        with open(os.path.join(entry_dir, "report.json"), "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        report = Report(stored["ticker"], stored["start_date"], stored["end_date"])
+        for section in stored["sections"]:
+            charts = [_copy(os.path.join(entry_dir, chart), output_dir) for chart in section["charts"]]
+            report.add_section(section["name"], section["lines"], charts=charts)
+        report.metrics = stored["metrics"]
+        report.tables = stored["tables"]
+        csv_filename = _copy(os.path.join(entry_dir, stored["csv"]), output_dir)
+        pdf_filename = _copy(os.path.join(entry_dir, stored["pdf"]), output_dir)
+        report.pdf_filename = pdf_filename
+        peers = stored.get("peers")
+        return {
+            "ticker": report.ticker,
+            "start_date": report.start_date,
+            "end_date": report.end_date,
+            "csv_filename": csv_filename,
+            "pdf_filename": pdf_filename,
+            "report": report,
+            "final_analysis": report.to_text(),
+            "charts": report.charts,
+            "metrics": report.metrics or None,
+            "peers": pd.read_json(io.StringIO(peers), orient="table") if peers else None,
+            "verdict": stored["verdict"],
+            "sizes": stored.get("sizes"),
+            "cached": True,
+        }
+
+    def store(self, key, result):
+        # Copies the report's files into a fresh directory that replaces any
+        # previous entry for key, then evicts least recently used entries.
+        report = result["report"]
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f"{key[:12]}.", dir=self.root)
+        try:
+            sections = []
+            for section in report.sections:
+                charts = [os.path.basename(_copy(c, tmp_dir)) for c in section["charts"] if c and os.path.exists(c)]
+                sections.append({"name": section["name"], "lines": section["lines"], "charts": charts})
+            peers = result.get("peers")
+            stored = {
+                "ticker": report.ticker,
+                "start_date": report.start_date,
+                "end_date": report.end_date,
+                "sections": sections,
+                "metrics": report.metrics,
+                "tables": report.tables,
+                "verdict": result["verdict"],
+                "sizes": result.get("sizes"),
+                "peers": peers.to_json(orient="table", double_precision=15) if peers is not None else None,
+                "csv": os.path.basename(_copy(result["csv_filename"], tmp_dir)),
+                "pdf": os.path.basename(_copy(result["pdf_filename"], tmp_dir)),
+            }
+            with open(os.path.join(tmp_dir, "report.json"), "w", encoding="utf-8") as f:
+                json.dump(stored, f, default=str)
+            size = sum(os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        with self._lock:
+            self._drop(key)
+            os.replace(tmp_dir, os.path.join(self.root, key))
+            now = time.time()
+            self._entries[key] = {"ticker": report.ticker, "created": now, "used": now, "bytes": size}
+            self._evict(keep=key)
+            self._save()
+
+    def _evict(self, keep=None):
+        total = sum(e["bytes"] for e in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["used"]):
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                total -= self._entries[key]["bytes"]
+                self._drop(key)
+
+    def refresh(self, key, generate):
+        # Regenerates a stale entry in the background; generate(output_dir)
+        # returns a generate_report result. At most one refresh per key.
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=REPORT_REFRESH_WORKERS, thread_name_prefix="report-refresh")
+        self._pool.submit(self._refresh, key, generate)
+        return True
+
+    def _refresh(self, key, generate):
+        work_dir = tempfile.mkdtemp(prefix="report-refresh.")
+        try:
+            with tracing.span("report_cache.refresh"):
+                self.store(key, generate(work_dir))
+        except Exception:
+            pass
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+report_cache = ReportCache()
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Modules create their caches under DUEDILIGENCE_CACHE_DIR at import time
+os.environ.setdefault("DUEDILIGENCE_CACHE_DIR", tempfile.mkdtemp(prefix="duediligence-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
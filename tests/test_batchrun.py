@@ -0,0 +1,37 @@
+import json
+import os
+import threading
+
+import pytest
+
+import batchrun
+
+
+@pytest.fixture
+def reports(monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def cached_report(ticker, start_date, end_date, output_dir="", **kwargs):
+        with lock:
+            calls.append(ticker)
+        return {"pdf_filename": os.path.join(output_dir, f"{ticker}.pdf"), "verdict": "PASS", "metrics": {}, "sizes": None}
+
+    monkeypatch.setattr(batchrun.pipeline, "cached_report", cached_report)
+    monkeypatch.setattr(batchrun.chartrender, "warm_up", lambda: None)
+    monkeypatch.setattr(batchrun, "resolve_tickers", lambda names: {
+        name: {"Microsoft": "MSFT", "MSFT": "MSFT", "Apple": "AAPL"}.get(name) for name in names
+    })
+    return calls
+
+
+def test_names_resolving_to_one_ticker_share_a_report(reports, tmp_path):
+    summaries = batchrun.run_batch(["Microsoft", "MSFT", "Apple", "Nope"], "2023-01-01", "2023-06-01",
+                                   output_dir=str(tmp_path), workers=4)
+    assert sorted(reports) == ["AAPL", "MSFT"]
+    assert [s["input"] for s in summaries] == ["Microsoft", "MSFT", "Apple", "Nope"]
+    assert [s["status"] for s in summaries] == ["ok", "ok", "ok", "unresolved"]
+    assert summaries[0]["pdf_filename"] == summaries[1]["pdf_filename"]
+    for name in ("Microsoft", "MSFT", "Apple", "Nope"):
+        with open(batchrun._summary_path(str(tmp_path), name, "2023-01-01", "2023-06-01"), encoding="utf-8") as f:
+            assert json.load(f)["input"] == name
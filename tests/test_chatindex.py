@@ -0,0 +1,60 @@
+import math
+
+import pytest
+
+import chatindex
+from chatindex import BM25Index, chunk_report, split_sections, tokenize
+
+REPORT = """# ACME
+## Technical Indicators
+RSI is 71 which signals overbought conditions.
+## Risks
+Debt levels are high and the debt maturity wall is in 2026.
+## Valuation
+The price to earnings ratio is 14, below the sector average.
+"""
+
+
+def test_tokenize_drops_stopwords_and_keeps_numbers():
+    assert tokenize("The P/E is 14.5 of the price") == ["p", "e", "14.5", "price"]
+
+
+def test_split_sections_keeps_headings_with_their_body():
+    titles = [title for title, _ in split_sections(REPORT)]
+    assert titles == ["ACME", "Technical Indicators", "Risks", "Valuation"]
+
+
+def test_long_sections_are_chunked_with_overlap():
+    text = "## Long\n" + " ".join(f"w{i}" for i in range(400))
+    chunks = chunk_report(text, chunk_words=100, overlap=20)
+    assert all(c["section"] == "Long" for c in chunks)
+    assert chunks[1]["text"].startswith("Long: ")
+    first, second = chunks[0]["text"].split(), chunks[1]["text"].split()[1:]
+    assert first[-20:] == second[:20]
+
+
+def test_search_ranks_the_matching_section_first():
+    index = BM25Index(chunk_report(REPORT))
+    assert index.chunks[index.search("how much debt?")[0]]["section"] == "Risks"
+    assert index.chunks[index.search("earnings ratio")[0]]["section"] == "Valuation"
+    assert index.search("unrelated words only") == []
+
+
+def test_bm25_weights_rare_terms_and_normalizes_length():
+    chunks = [
+        {"section": "", "text": "beta beta beta"},
+        {"section": "", "text": "alpha beta"},
+        {"section": "", "text": "alpha beta gamma delta epsilon zeta eta theta"},
+    ]
+    index = BM25Index(chunks)
+    assert index._idf["alpha"] == pytest.approx(math.log(1 + 1.5 / 2.5))
+    assert index._idf["alpha"] > index._idf["beta"]
+    # Same term frequency: the shorter chunk ranks first
+    assert index.search("alpha") == [1, 2]
+    # The rare term outweighs repeated common ones
+    assert index.search("alpha beta")[0] == 1
+    assert index.search("alpha", k=1) == [1]
+
+
+def test_get_index_is_cached_per_report():
+    assert chatindex.get_index(REPORT) is chatindex.get_index(REPORT)
@@ -0,0 +1,47 @@
+import contextbudget
+from contextbudget import estimate_tokens, fit, summarize
+
+ANALYSIS = "\n".join(
+    ["## Overview"]
+    + [f"Paragraph {i} describes the business in some detail without taking a position." for i in range(60)]
+    + ["## Risks", "Key risk: customer concentration above 40% of revenue."]
+    + [f"Filler line {i} about operations and the market in general terms." for i in range(60)]
+    + ["## Conclusion", "Overall recommendation: hold, with moderate risk."]
+)
+
+
+def test_fit_keeps_everything_under_budget():
+    parts = [("Metrics", "| a | 1 |", False), ("Previous analysis", "short text", True)]
+    assert fit(parts, budget=1000) == "Metrics:\n| a | 1 |\n\nPrevious analysis:\nshort text"
+
+
+def test_fit_skips_empty_parts():
+    assert fit([("", "", False), ("", "kept", True)], budget=100) == "kept"
+
+
+def test_fit_summarizes_only_compressible_parts():
+    fixed = "| metric | value |\n" * 50
+    joined = fit([("", fixed, False), ("", ANALYSIS, True)], budget=500)
+    assert joined.startswith(fixed.strip("\n"))
+    assert estimate_tokens(joined) < estimate_tokens(fixed) + estimate_tokens(ANALYSIS)
+    assert estimate_tokens(joined) <= 500 + contextbudget.MIN_SUMMARY_TOKENS
+
+
+def test_fixed_parts_are_never_summarized():
+    fixed = "x" * 8000
+    assert fit([("", fixed, False)], budget=100) == fixed
+
+
+def test_summary_keeps_headings_and_conclusions():
+    summary = summarize(ANALYSIS, 150)
+    assert estimate_tokens(summary) <= 150
+    for line in ("## Overview", "## Risks", "## Conclusion",
+                 "Key risk: customer concentration above 40% of revenue.",
+                 "Overall recommendation: hold, with moderate risk."):
+        assert line in summary.split("\n")
+    # Original order is preserved
+    assert summary.index("## Risks") < summary.index("## Conclusion")
+
+
+def test_summaries_are_cached():
+    assert summarize(ANALYSIS, 200) is summarize(ANALYSIS, 200)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+import downsample
+
+
+def bars(periods, freq="5min"):
+    index = pd.date_range("2023-01-02 09:30", periods=periods, freq=freq, name="Date")
+    close = np.arange(periods, dtype="float64") + 100
+    return pd.DataFrame({
+        "Open": close - 0.5, "High": close + 1, "Low": close - 1, "Close": close, "Volume": np.ones(periods),
+    }, index=index)
+
+
+def test_lttb_keeps_endpoints_and_count():
+    x = np.arange(1000, dtype="float64")
+    y = np.sin(x / 50)
+    selected = downsample.lttb_indices(x, y, 100)
+    assert len(selected) == 100
+    assert selected[0] == 0 and selected[-1] == 999
+    assert (np.diff(selected) > 0).all()
+
+
+def test_lttb_keeps_spikes():
+    x = np.arange(1000, dtype="float64")
+    y = np.zeros(1000)
+    y[[137, 512, 880]] = [10, -10, 5]
+    selected = downsample.lttb_indices(x, y, 50)
+    assert {137, 512, 880} <= set(selected.tolist())
+
+
+def test_lttb_returns_everything_when_under_threshold():
+    np.testing.assert_array_equal(downsample.lttb_indices(np.arange(10.0), np.arange(10.0), 20), np.arange(10))
+
+
+def test_lttb_frame_keeps_rows_for_every_column():
+    index = pd.bdate_range("2020-01-01", periods=2000)
+    frame = pd.DataFrame({"a": np.sin(np.arange(2000) / 30), "b": np.r_[np.full(1000, np.nan), np.arange(1000.0)]},
+                         index=index)
+    reduced = downsample.lttb_frame(frame, 200)
+    assert len(reduced) <= 200
+    assert reduced.index[0] == index[0] and reduced.index[-1] == index[-1]
+    assert reduced["b"].notna().sum() >= 3
+
+
+def test_ohlc_resample_aggregates_each_column():
+    data = bars(24)
+    hourly = downsample.ohlc_resample(data, "1h")
+    first = data.loc[:"2023-01-02 09:55"]
+    assert hourly.iloc[0]["Open"] == first["Open"].iloc[0]
+    assert hourly.iloc[0]["High"] == first["High"].max()
+    assert hourly.iloc[0]["Low"] == first["Low"].min()
+    assert hourly.iloc[0]["Close"] == first["Close"].iloc[-1]
+    assert hourly.iloc[0]["Volume"] == first["Volume"].sum()
+    assert hourly["Volume"].sum() == data["Volume"].sum()
+
+
+def test_ohlc_resample_drops_empty_buckets():
+    data = pd.concat([bars(3), bars(3).shift(3, freq="D")])
+    assert len(downsample.ohlc_resample(data, "1D")) == 2
+
+
+def test_ohlc_downsample_picks_the_finest_rule_that_fits():
+    data = bars(78 * 20)
+    assert downsample.ohlc_downsample(data, 5000) is data
+    reduced = downsample.ohlc_downsample(data, 600)
+    # 1560 five minute bars: 30 minute bars (260) would also fit, 15 minute ones (520) are finer
+    assert len(reduced) == 520
+    assert pd.Series(reduced.index).diff().min() == pd.Timedelta(minutes=15)
+    assert reduced["Volume"].sum() == data["Volume"].sum()
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+
+
+def prices(values):
+    index = pd.bdate_range("2023-01-02", periods=len(values), name="Date")
+    return pd.DataFrame({"Close": np.asarray(values, dtype="float64")}, index=index)
+
+
+def test_rsi_is_100_without_losses_and_0_without_gains():
+    rising = indicators._rsi(pd.Series(np.arange(1, 40, dtype="float64")))
+    falling = indicators._rsi(pd.Series(np.arange(40, 1, -1, dtype="float64")))
+    assert rising.iloc[-1] == 100
+    assert falling.iloc[-1] == pytest.approx(0)
+
+
+def test_rsi_matches_wilder_smoothing():
+    close = pd.Series([44.34, 44.09, 44.15, 43.61, 44.33, 44.83, 45.10, 45.42, 45.84, 46.08,
+                       45.89, 46.03, 45.61, 46.28, 46.28, 46.00, 46.03, 46.41, 46.22, 45.64])
+    delta = close.diff().dropna()
+    gain, loss = delta.clip(lower=0).to_numpy(), (-delta.clip(upper=0)).to_numpy()
+    avg_gain, avg_loss = gain[0], loss[0]
+    for g, l in zip(gain[1:], loss[1:]):
+        avg_gain += (g - avg_gain) / 14
+        avg_loss += (l - avg_loss) / 14
+    rsi = indicators._rsi(close)
+    assert rsi.iloc[:13].isna().all()
+    assert rsi.iloc[-1] == pytest.approx(100 - 100 / (1 + avg_gain / avg_loss))
+
+
+def test_macd_is_the_ema_spread_and_its_signal():
+    close = pd.Series(np.linspace(10, 30, 120) + np.sin(np.arange(120)))
+    frame = indicators.compute_indicators(prices(close))["frame"]
+    ema12 = frame["Close"].ewm(span=12, adjust=False).mean()
+    ema26 = frame["Close"].ewm(span=26, adjust=False).mean()
+    np.testing.assert_allclose(frame["MACD"], ema12 - ema26)
+    np.testing.assert_allclose(frame["MACD_Signal"], (ema12 - ema26).ewm(span=9, adjust=False).mean())
+    np.testing.assert_allclose(frame["MACD_Hist"], frame["MACD"] - frame["MACD_Signal"])
+
+
+def test_drawdown_from_running_peak():
+    result = indicators.compute_indicators(prices([100, 120, 90, 110, 60, 130]))
+    np.testing.assert_allclose(result["frame"]["Drawdown"], [0, 0, -0.25, -1 / 12, -0.5, 0])
+    assert result["summary"]["max_drawdown_pct"] == pytest.approx(-50)
+    assert result["summary"]["change_pct"] == pytest.approx(30)
+
+
+def test_nan_closes_are_ignored_and_short_series_return_none():
+    assert indicators.compute_indicators(prices([np.nan, 5.0, np.nan])) is None
+    result = indicators.compute_indicators(prices([np.nan, 10.0, np.nan, 12.0]))
+    assert result["summary"]["start_price"] == 10 and result["summary"]["end_price"] == 12
+
+
+def test_beta_against_benchmark():
+    rng = np.random.default_rng(0)
+    bench = 100 * np.cumprod(1 + rng.normal(0, 0.01, 200))
+    stock = 100 * np.cumprod(1 + 2 * (bench[1:] / bench[:-1] - 1))
+    summary = indicators.compute_indicators(prices(np.r_[100, stock]), prices(bench))["summary"]
+    assert summary["beta"] == pytest.approx(2)
+    assert summary["correlation"] == pytest.approx(1)
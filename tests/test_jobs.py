@@ -0,0 +1,127 @@
+import threading
+
+import pytest
+
+import jobs
+from report import Report
+
+
+@pytest.fixture
+def manager():
+    manager = jobs.JobManager(max_workers=2)
+    yield manager
+    manager._pool.shutdown(wait=True)
+
+
+def wait_done(manager, job_id):
+    job = manager.get(job_id)
+    try:
+        job.future.result(timeout=5)
+    except Exception:
+        pass
+    return job
+
+
+def test_identical_submits_share_one_run(manager):
+    release = threading.Event()
+    calls = []
+
+    def work(job, value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    first = manager.submit("report", ("AAA", "2023"), work, 21)
+    second = manager.submit("report", ("AAA", "2023"), work, 21)
+    other = manager.submit("report", ("BBB", "2023"), work, 1)
+    assert first == second != other
+    release.set()
+    assert wait_done(manager, first).result == 42
+    assert sorted(calls) == [1, 21]
+    # Once finished, the same key starts a new run
+    assert manager.submit("report", ("AAA", "2023"), work, 21) != first
+
+
+def test_cancel_takes_effect_at_the_next_stage(manager):
+    in_stage = threading.Event()
+    release = threading.Event()
+    reached = []
+
+    def work(job):
+        job.enter_stage("download")
+        in_stage.set()
+        release.wait(5)
+        job.enter_stage("agent")
+        reached.append("agent")
+
+    job_id = manager.submit("report", "k", work, stages=("download", "agent"))
+    assert in_stage.wait(5)
+    assert manager.cancel(job_id)
+    # A new identical submit does not join the cancelled run
+    assert manager.submit("report", "k", lambda job: None) != job_id
+    release.set()
+    job = wait_done(manager, job_id)
+    assert job.status == jobs.CANCELLED and reached == []
+    assert not manager.cancel(job_id)
+
+
+def test_cancel_requested_after_the_last_stage_still_cancels(manager):
+    in_stage = threading.Event()
+    release = threading.Event()
+
+    def work(job):
+        job.enter_stage("render")
+        in_stage.set()
+        release.wait(5)
+        return "done"
+
+    job_id = manager.submit("report", "k", work, stages=("render",))
+    assert in_stage.wait(5)
+    manager.cancel(job_id)
+    release.set()
+    job = wait_done(manager, job_id)
+    assert job.status == jobs.CANCELLED
+
+
+def test_failures_are_reported(manager):
+    def work(job):
+        raise ValueError("boom")
+
+    job = wait_done(manager, manager.submit("report", "k", work))
+    assert job.status == jobs.FAILED and job.error == "boom"
+
+
+def test_comprehensive_key_follows_report_content():
+    first = Report("AAA", "2023-01-01", "2023-06-01")
+    first.add_section("basic", ["**Ticker:** AAA"])
+    second = Report("AAA", "2023-01-01", "2023-06-01")
+    second.add_section("basic", ["**Ticker:** AAA"])
+    assert jobs.comprehensive_key(first) == jobs.comprehensive_key(second)
+    second.add_section("peers", ["MSFT"])
+    assert jobs.comprehensive_key(first) != jobs.comprehensive_key(second)
+
+
+def test_comprehensive_runs_on_a_copy_in_the_job_namespace(manager, tmp_path, monkeypatch):
+    import artifacts
+    monkeypatch.setattr(artifacts, "artifact_store", artifacts.ArtifactStore(root=str(tmp_path / "artifacts")))
+    session_dir = tmp_path / "session"
+    session_dir.mkdir()
+    csv_filename = session_dir / "AAA.csv"
+    csv_filename.write_text("Date,Close\n")
+    report = Report("AAA", "2023-01-01", "2023-06-01")
+    report.add_section("basic", ["**Ticker:** AAA"])
+    report.pdf_filename = str(session_dir / "AAA_analysis.pdf")
+
+    def comprehensive(report, csv_filename, progress=None, on_output=None):
+        report.add_section("comprehensive", ["deep dive"])
+        return "deep dive", report.write_pdf(report.pdf_filename.replace("AAA_", "cmprhsive_AAA_"))
+
+    monkeypatch.setattr(jobs.pipeline, "comprehensive_due_diligence", comprehensive)
+    monkeypatch.setattr(jobs, "job_manager", manager)
+    job_id = jobs.submit_comprehensive(report, str(csv_filename))
+    assert jobs.submit_comprehensive(report, str(csv_filename)) == job_id
+    result = wait_done(manager, job_id).result
+    job_dir = str(tmp_path / "artifacts" / f"job-{job_id}")
+    assert result["pdf_filename"].startswith(job_dir) and result["csv_filename"].startswith(job_dir)
+    assert result["report"].section_text("comprehensive") == "deep dive"
+    assert report.section("comprehensive") is None
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import peergroup
+
+
+def closes(columns, periods=60):
+    index = pd.bdate_range("2023-01-02", periods=periods, name="Date")
+    return pd.DataFrame(columns, index=index, dtype="float64")
+
+
+def test_ranks_by_return_and_volatility():
+    rng = np.random.default_rng(1)
+    frame = closes({
+        "AAA": np.linspace(100, 150, 60),
+        "BBB": np.linspace(100, 110, 60) + rng.normal(0, 2, 60),
+        "CCC": np.linspace(100, 90, 60),
+        "^GSPC": np.linspace(100, 105, 60),
+    })
+    analytics = peergroup.peer_analytics(frame, target="AAA", benchmark="^GSPC")
+    table = analytics["table"]
+    assert table.loc["AAA", "rank"] == 1 and table.loc["CCC", "rank"] == 3
+    assert np.isnan(table.loc["^GSPC", "rank"])
+    assert table.loc["AAA", "total_return_pct"] == pytest.approx(50)
+    assert table.loc["^GSPC", "beta"] == pytest.approx(1)
+    assert analytics["tickers"] == 3
+    assert peergroup.peer_summary(analytics)[0].startswith("**Return Rank:** 1 of 3 (risk rank ")
+
+
+def test_summary_without_a_risk_rank():
+    # Two closes give a return but no volatility for the target
+    frame = closes({"AAA": [np.nan] * 58 + [100, 110], "BBB": np.linspace(100, 105, 60)})
+    analytics = peergroup.peer_analytics(frame, target="AAA", benchmark="^GSPC")
+    assert np.isnan(analytics["table"].loc["AAA", "risk_rank"])
+    assert "(risk rank n/a, lowest volatility first)" in peergroup.peer_summary(analytics)[0]
+
+
+def test_parse_peers_splits_and_dedupes():
+    assert peergroup.parse_peers("MSFT, aapl\nMSFT;  ") == ["MSFT", "aapl"]
+    assert peergroup.parse_peers("") == []
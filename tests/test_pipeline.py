@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+import pipeline
+
+
+def prices(values):
+    index = pd.bdate_range("2023-01-02", periods=len(values), name="Date")
+    return pd.DataFrame({"Close": np.asarray(values, dtype="float64"), "Volume": 1000.0}, index=index)
+
+
+def no_benchmark(*args, **kwargs):
+    raise RuntimeError("offline")
+
+
+def test_basic_analysis_reports_indicators(monkeypatch):
+    monkeypatch.setattr(pipeline, "get_prices", no_benchmark)
+    analysis, metrics = pipeline.basic_analysis("AAA", "2023-01-02", "2023-06-01", prices(np.linspace(100, 120, 100)))
+    assert "**Change:** 20.00%" in analysis
+    assert "## Technical Indicators" in analysis
+    assert metrics["table"] in "\n".join(analysis)
+
+
+def test_basic_analysis_degrades_when_nan_closes_leave_one_value(monkeypatch):
+    # The report still renders, with a note instead of the indicator section
+    monkeypatch.setattr(pipeline, "get_prices", no_benchmark)
+    analysis, metrics = pipeline.basic_analysis("AAA", "a", "b", prices([np.nan, np.nan, 5.0, np.nan]))
+    assert metrics is None
+    assert analysis[-1] == "Not enough data to generate analysis for the selected period."
+
+
+def test_basic_analysis_degrades_when_indicators_fail(monkeypatch):
+    monkeypatch.setattr(pipeline, "get_prices", no_benchmark)
+    monkeypatch.setattr(pipeline.indicators, "compute_indicators", lambda data, benchmark: 1 / 0)
+    analysis, metrics = pipeline.basic_analysis("AAA", "a", "b", prices([1.0, 2.0, 3.0]))
+    assert metrics is None
+    assert analysis[-1].startswith("Error calculating analysis: ")
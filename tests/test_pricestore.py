@@ -0,0 +1,147 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pricestore
+from pricestore import PriceStore, _chunks, _gaps, _merge_intervals, has_trading_days
+
+
+def day(value):
+    return pd.Timestamp(value)
+
+
+class FakeDownloader:
+    # yf.download stand-in: one row per business day in [start, end) in the
+    # (Price, Ticker) layout; empty for the ranges listed in fail.
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = list(fail)
+
+    def __call__(self, tickers, start=None, end=None, interval="1d", progress=False):
+        symbols = [tickers] if isinstance(tickers, str) else list(tickers)
+        self.calls.append((tuple(symbols), day(start), day(end)))
+        if (day(start), day(end)) in self.fail:
+            return pd.DataFrame()
+        index = pd.bdate_range(start, day(end) - timedelta(days=1), name="Date")
+        columns = {}
+        for symbol in symbols:
+            columns[("Close", symbol)] = np.arange(len(index), dtype="float64") + 100
+            columns[("Volume", symbol)] = np.full(len(index), 1000.0)
+        return pd.DataFrame(columns, index=index)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PriceStore(root=str(tmp_path), downloader=FakeDownloader())
+
+
+def test_merge_intervals_joins_overlapping_and_touching():
+    merged = _merge_intervals([[day("2023-03-01"), day("2023-04-01")], [day("2023-01-01"), day("2023-02-01")],
+                               [day("2023-02-01"), day("2023-02-15")]])
+    assert merged == [[day("2023-01-01"), day("2023-02-15")], [day("2023-03-01"), day("2023-04-01")]]
+
+
+def test_gaps_returns_missing_ranges_only():
+    have = [[day("2023-01-10"), day("2023-01-20")], [day("2023-02-01"), day("2023-02-10")]]
+    assert _gaps(have, day("2023-01-01"), day("2023-03-01")) == [
+        (day("2023-01-01"), day("2023-01-10")),
+        (day("2023-01-20"), day("2023-02-01")),
+        (day("2023-02-10"), day("2023-03-01")),
+    ]
+    assert _gaps(have, day("2023-01-12"), day("2023-01-18")) == []
+
+
+def test_chunks_respect_the_download_limit():
+    start, end = day("2023-01-01"), day("2023-07-01")
+    chunks = _chunks([(start, end)], "5m")
+    assert chunks[0][0] == start and chunks[-1][1] == end
+    assert all(b - a <= timedelta(days=59) for a, b in chunks)
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+    assert _chunks([(start, end)], "1d") == [(start, end)]
+
+
+def test_has_trading_days_skips_weekends_and_holidays():
+    # Saturday to Monday, and the Christmas holiday on a Monday
+    assert not has_trading_days(day("2023-12-23"), day("2023-12-26"))
+    assert not has_trading_days(day("2023-12-25"), day("2023-12-26"))
+    assert has_trading_days(day("2023-12-26"), day("2023-12-27"))
+
+
+def test_stored_range_is_not_downloaded_again(store):
+    first = store.get("AAA", "2023-01-02", "2023-02-01")
+    second = store.get("AAA", "2023-01-09", "2023-01-20")
+    assert len(store.downloader.calls) == 1
+    assert second.index.min() >= day("2023-01-09") and second.index.max() < day("2023-01-20")
+    assert list(second.index) == [d for d in first.index if day("2023-01-09") <= d < day("2023-01-20")]
+
+
+def test_empty_download_on_trading_days_leaves_the_gap_open(tmp_path):
+    store = PriceStore(root=str(tmp_path), downloader=FakeDownloader(fail=[(day("2023-03-01"), day("2023-03-10"))]))
+    assert store.get("AAA", "2023-03-01", "2023-03-10").empty
+    assert store.missing_ranges("AAA", "2023-03-01", "2023-03-10") == [(day("2023-03-01"), day("2023-03-10"))]
+    store.downloader.fail = []
+    assert len(store.get("AAA", "2023-03-01", "2023-03-10")) == 7
+    assert store.missing_ranges("AAA", "2023-03-01", "2023-03-10") == []
+
+
+def test_empty_download_over_a_holiday_is_covered(tmp_path):
+    store = PriceStore(root=str(tmp_path), downloader=FakeDownloader(fail=[(day("2023-12-23"), day("2023-12-26"))]))
+    assert store.get("AAA", "2023-12-23", "2023-12-26").empty
+    assert store.missing_ranges("AAA", "2023-12-23", "2023-12-26") == []
+
+
+def test_get_many_shares_one_download_per_gap(store):
+    store.get("AAA", "2023-01-02", "2023-02-01")
+    matrix = store.get_many(["AAA", "BBB", "CCC"], "2023-01-02", "2023-03-01")
+    calls = sorted(store.downloader.calls[1:])
+    # BBB and CCC miss the whole range, AAA only February
+    assert calls == [
+        (("AAA",), day("2023-02-01"), day("2023-03-01")),
+        (("BBB", "CCC"), day("2023-01-02"), day("2023-03-01")),
+    ]
+    assert list(matrix.columns) == ["AAA", "BBB", "CCC"]
+    assert matrix.notna().all().all()
+
+
+def test_parts_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(pricestore, "PRICE_CHUNK_DAYS", 30)
+    store = PriceStore(root=str(tmp_path), downloader=FakeDownloader(), max_parts=3)
+    data = store.get("AAA", "2022-01-03", "2022-07-01")
+    assert len(store._meta[("AAA", "1d")]["parts"]) <= 3
+    assert data.index.is_monotonic_increasing and not data.index.duplicated().any()
+    reopened = PriceStore(root=str(tmp_path), downloader=FakeDownloader(), offline=True)
+    pd.testing.assert_frame_equal(reopened.get("AAA", "2022-01-03", "2022-07-01"), data, check_freq=False)
+
+
+class UpperCasingDownloader(FakeDownloader):
+    # Like yf.download, which reports columns under upper-cased symbols
+    def __call__(self, tickers, **kwargs):
+        tickers = tickers.upper() if isinstance(tickers, str) else [t.upper() for t in tickers]
+        return super().__call__(tickers, **kwargs)
+
+
+def test_lowercase_tickers_share_the_upper_case_entry(tmp_path):
+    store = PriceStore(root=str(tmp_path), downloader=UpperCasingDownloader())
+    lower = store.get("msft", "2023-01-02", "2023-02-01")
+    assert len(lower) == 22
+    pd.testing.assert_frame_equal(store.get("MSFT", "2023-01-02", "2023-02-01"), lower)
+    assert len(store.downloader.calls) == 1
+    matrix = store.get_many(["msft", "aapl"], "2023-01-02", "2023-02-01")
+    assert list(matrix.columns) == ["msft", "aapl"]
+    assert matrix.notna().all().all()
+
+
+def test_intraday_ranges_outside_retention_are_not_requested(store):
+    today = pd.Timestamp.today().normalize()
+    start = today - timedelta(days=400)
+    store.get("AAA", start, today - timedelta(days=1), interval="5m")
+    first_call = store.downloader.calls[0]
+    assert first_call[1] >= today - timedelta(days=59)
+    assert all(call[1] >= first_call[1] for call in store.downloader.calls)
+    # The expired part is recorded as covered, so nothing before the window is retried
+    calls = len(store.downloader.calls)
+    store.get("AAA", start, today - timedelta(days=1), interval="5m")
+    assert len(store.downloader.calls) == calls
+    assert store.missing_ranges("AAA", start, today - timedelta(days=60), interval="5m") == []
@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+import pytest
+
+from report import Report
+from reportcache import ReportCache
+
+
+def make_result(directory, ticker="AAA", pdf_bytes=100):
+    os.makedirs(directory, exist_ok=True)
+    report = Report(ticker, "2023-01-01", "2023-06-01")
+    report.add_section("basic", [f"**Ticker:** {ticker}"])
+    csv_filename = os.path.join(directory, f"{ticker}.csv")
+    pdf_filename = os.path.join(directory, f"{ticker}.pdf")
+    with open(csv_filename, "w", encoding="utf-8") as f:
+        f.write("Date,Close\n")
+    with open(pdf_filename, "wb") as f:
+        f.write(b"%" * pdf_bytes)
+    return {"report": report, "csv_filename": csv_filename, "pdf_filename": pdf_filename, "verdict": "PASS"}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ReportCache(root=str(tmp_path / "cache"), ttl=100, stale_ttl=1000)
+
+
+def test_fresh_hit_copies_files_into_output_dir(cache, tmp_path):
+    cache.store("k", make_result(str(tmp_path / "work")))
+    out = tmp_path / "out"
+    out.mkdir()
+    result = cache.lookup("k", str(out))
+    assert result["cached"] and not result["stale"]
+    assert result["pdf_filename"] == str(out / "AAA.pdf") and os.path.exists(result["pdf_filename"])
+    assert result["final_analysis"].startswith("**Ticker:** AAA")
+    assert cache.lookup("other", str(out)) is None
+
+
+def test_entries_are_stale_then_expire(cache, tmp_path, monkeypatch):
+    cache.store("k", make_result(str(tmp_path / "work")))
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 500)
+    assert cache.lookup("k", str(tmp_path))["stale"]
+    monkeypatch.setattr(time, "time", lambda: now + 2000)
+    assert cache.lookup("k", str(tmp_path)) is None
+    assert not os.path.exists(os.path.join(cache.root, "k"))
+
+
+def test_stale_entry_is_refreshed_once_in_the_background(cache, tmp_path):
+    cache.store("k", make_result(str(tmp_path / "work")))
+    release = threading.Event()
+    calls = []
+
+    def generate(work_dir):
+        calls.append(work_dir)
+        release.wait(5)
+        return make_result(work_dir, pdf_bytes=10)
+
+    assert cache.refresh("k", generate)
+    assert not cache.refresh("k", generate)
+    release.set()
+    cache._pool.shutdown(wait=True)
+    assert len(calls) == 1
+    assert os.path.getsize(cache.lookup("k", str(tmp_path))["pdf_filename"]) == 10
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    cache = ReportCache(root=str(tmp_path / "cache"), max_bytes=3000)
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    for key in ("a", "b"):
+        clock[0] += 1
+        cache.store(key, make_result(str(tmp_path / key), pdf_bytes=1000))
+    clock[0] += 1
+    assert cache.lookup("a", str(tmp_path)) is not None
+    clock[0] += 1
+    cache.store("c", make_result(str(tmp_path / "c"), pdf_bytes=1000))
+    assert set(cache._entries) == {"a", "c"}
+    assert not os.path.exists(os.path.join(cache.root, "b"))
+    # The index survives a restart
+    assert set(ReportCache(root=cache.root, max_bytes=3000)._entries) == {"a", "c"}
+
+
+def test_missing_files_drop_the_entry(cache, tmp_path):
+    cache.store("k", make_result(str(tmp_path / "work")))
+    os.remove(os.path.join(cache.root, "k", "AAA.pdf"))
+    assert cache.lookup("k", str(tmp_path)) is None
+    assert "k" not in cache._entries
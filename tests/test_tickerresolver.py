@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+import tickerresolver
+from tickerresolver import TickerCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = TickerCache(path=str(tmp_path / "tickers.json"), ttl=100, negative_ttl=10)
+    monkeypatch.setattr(tickerresolver, "ticker_cache", cache)
+    return cache
+
+
+def test_typed_symbols_are_stored_upper_case(cache, monkeypatch):
+    monkeypatch.setattr(tickerresolver, "_has_history", lambda symbol: True)
+    assert tickerresolver.resolve_ticker(" msft ") == "MSFT"
+    assert tickerresolver.resolve_ticker("MSFT") == "MSFT"
+    assert cache.lookup("MSFT") == (True, "MSFT")
+
+
+def test_bulk_probe_stores_upper_case(cache, monkeypatch):
+    probed = []
+    monkeypatch.setattr(tickerresolver, "_bulk_history_probe", lambda symbols: probed.extend(symbols) or set(symbols))
+    assert tickerresolver.resolve_tickers(["msft", "MSFT"]) == {"msft": "MSFT", "MSFT": "MSFT"}
+    assert probed == ["MSFT"]
+
+
+def test_entries_expire_after_ttl(cache, monkeypatch):
+    now = time.time()
+    cache.store("MSFT", "MSFT")
+    cache.store("NOPE INC", None)
+    monkeypatch.setattr(time, "time", lambda: now + 50)
+    # Negative entries use the shorter TTL
+    assert cache.lookup("MSFT") == (True, "MSFT")
+    assert cache.lookup("NOPE INC") == (False, None)
+    monkeypatch.setattr(time, "time", lambda: now + 150)
+    assert cache.lookup("MSFT") == (False, None)
+
+
+def test_entries_survive_a_reload(cache):
+    cache.store("MICROSOFT", "MSFT")
+    assert TickerCache(path=cache.path).lookup("MICROSOFT") == (True, "MSFT")
+
+
+def test_concurrent_lookups_share_one_resolver_call(cache):
+    calls = []
+
+    def resolver():
+        calls.append(1)
+        time.sleep(0.1)
+        return "MSFT", True
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_resolve("MICROSOFT", resolver)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ["MSFT"] * 5
+
+
+def test_uncacheable_results_are_not_stored(cache):
+    assert cache.get_or_resolve("ACME", lambda: (None, False)) is None
+    assert cache.lookup("ACME") == (False, None)
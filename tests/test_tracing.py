@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def trace_log(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_LOG_PATH", str(path))
+    monkeypatch.setattr(tracing, "TRACE_LOG_MAX_BYTES", 2000)
+    monkeypatch.setattr(tracing, "TRACE_LOG_BACKUPS", 2)
+    monkeypatch.setattr(tracing, "METRICS_PATH", str(tmp_path / "metrics.prom"))
+    monkeypatch.setattr(tracing, "_log_configured", False)
+    handlers = list(tracing.logger.handlers)
+    for handler in handlers:
+        tracing.logger.removeHandler(handler)
+    yield path
+    for handler in list(tracing.logger.handlers):
+        tracing.logger.removeHandler(handler)
+        handler.close()
+    for handler in handlers:
+        tracing.logger.addHandler(handler)
+
+
+def test_spans_are_logged_as_json_lines(trace_log):
+    with tracing.span("outer", ticker="AAA"):
+        with tracing.span("inner"):
+            tracing.add(bytes_sent=10)
+    lines = [json.loads(line) for line in trace_log.read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["outer", "inner"]
+
+
+def test_trace_log_is_rotated(trace_log):
+    for i in range(200):
+        with tracing.span("report", index=i):
+            pass
+    files = sorted(os.listdir(trace_log.parent))
+    assert files == ["metrics.prom", "traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"]
+    assert all(os.path.getsize(trace_log.parent / name) <= 2000 for name in files if name.startswith("traces"))
@@ -0,0 +1,201 @@
+import os
+import time
+
+import agentpool
+import tracing
+from config import CACHE_DIR
+from jsoncache import JsonCache
+
+TICKER_CACHE_PATH = os.path.join(CACHE_DIR, "tickers.json")
+TICKER_TTL = float(os.getenv("TICKER_TTL", 7 * 24 * 3600))
+NOTICKER_TTL = float(os.getenv("NOTICKER_TTL", 3600))
+
+BATCH_RESOLVER_INSTRUCTIONS = (
+    "You are a financial assistant. You will receive a numbered list of company names. "
+    "For every line respond with exactly one line in the form '<number>: <TICKER>' using the official US stock ticker symbol. "
+    "If you cannot find a ticker for a company, use NOTICKER for that line. "
+    "Don't include any other information."
+)
+
+
+def normalize_name(company_or_ticker):
+    return " ".join(str(company_or_ticker).split()).upper()
+
+
+def _parse_ticker(val):
+    val = val.strip().upper()
+    if not val or val.startswith("NOTICKER"):
+        return None
+    return val.split()[0].replace('.', '-')
+
+
+class TickerCache(JsonCache):
+    # Process-wide name -> ticker map persisted to disk. A value of None is a
+    # negative (NOTICKER) entry and expires after NOTICKER_TTL.
+    def __init__(self, path=TICKER_CACHE_PATH, ttl=TICKER_TTL, negative_ttl=NOTICKER_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        super().__init__(path)
+
+    def lookup(self, key):
+        # Returns (hit, ticker); hit is False when missing or expired.
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            ttl = self.ttl if entry["ticker"] else self.negative_ttl
+            if time.time() - entry["ts"] > ttl:
+                del self._entries[key]
+                return False, None
+            return True, entry["ticker"]
+
+    def store_many(self, results):
+        with self._lock:
+            now = time.time()
+            for key, ticker in results.items():
+                self._entries[key] = {"ticker": ticker, "ts": now}
+            self._save()
+
+    def store(self, key, ticker):
+        self.store_many({key: ticker})
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+    def get_or_resolve(self, key, resolver):
+        # Coalesces concurrent lookups of the same key onto a single resolver call.
+        hit, ticker = self.lookup(key)
+        if hit:
+            return ticker
+
+        def resolve():
+            ticker, cacheable = resolver()
+            if cacheable:
+                self.store(key, ticker)
+            return ticker
+
+        return self._coalesce(key, resolve)[0]
+
+
+ticker_cache = TickerCache()
+
+
+def _has_history(symbol):
+    import yfinance as yf
+    with tracing.span("history_probe", symbol=symbol):
+        try:
+            return not yf.Ticker(symbol).history(period="1d").empty
+        except Exception:
+            return False
+
+
+def _ask_resolver_agent(content, instructions=None):
+    thread_id, messages = agentpool.run_agent("ticker-resolver", content, instructions=instructions)
+    agentpool.delete_thread(thread_id)
+    texts = agentpool.assistant_texts(messages)
+    return texts[0] if texts else ""
+
+
+def _resolve_uncached(company_or_ticker):
+    # Returns (ticker, cacheable). Agent failures are not negatively cached.
+    tracing.add(cached=False)
+    if _has_history(company_or_ticker):
+        return company_or_ticker.strip().upper(), True
+    try:
+        answer = _ask_resolver_agent(f"What is the official US stock ticker for {company_or_ticker}?")
+    except Exception:
+        return None, False
+    return _parse_ticker(answer), True
+
+
+def resolve_ticker(company_or_ticker):
+    company_or_ticker = company_or_ticker.strip()
+    if not company_or_ticker:
+        return None
+    key = normalize_name(company_or_ticker)
+    with tracing.span("resolve_ticker", input=key, cached=True):
+        try:
+            return ticker_cache.get_or_resolve(key, lambda: _resolve_uncached(company_or_ticker))
+        except Exception:
+            return None
+
+
+def _bulk_history_probe(symbols):
+    # One yf.download call for every candidate that might already be a ticker.
+    if not symbols:
+        return set()
+    import yfinance as yf
+    try:
+        with tracing.span("yf.download", symbols=len(symbols)):
+            data = yf.download(symbols, period="5d", group_by="ticker", progress=False)
+    except Exception:
+        return set()
+    if data.empty:
+        return set()
+    found = set()
+    for symbol in symbols:
+        try:
+            frame = data[symbol] if data.columns.nlevels > 1 else data
+            if not frame['Close'].dropna().empty:
+                found.add(symbol)
+        except KeyError:
+            continue
+    return found
+
+
+def resolve_tickers(company_names):
+    # Resolves many names at once: cache hits first, then one bulk yfinance
+    # probe, then a single agent round trip for whatever is left.
+    keys = {}
+    known = {}
+    pending = {}
+    for name in company_names:
+        name = name.strip()
+        if not name:
+            continue
+        key = normalize_name(name)
+        keys[name] = key
+        if key in known or key in pending:
+            continue
+        hit, ticker = ticker_cache.lookup(key)
+        if hit:
+            known[key] = ticker
+        else:
+            pending[key] = name
+
+    resolved = {}
+    if pending:
+        # yfinance reports symbols upper-cased
+        probe = {key: name.upper() for key, name in pending.items() if " " not in name}
+        found = _bulk_history_probe(sorted(set(probe.values())))
+        for key, symbol in probe.items():
+            if symbol in found:
+                resolved[key] = symbol
+    remaining = [(key, name) for key, name in pending.items() if key not in resolved]
+
+    if remaining:
+        listing = "\n".join(f"{i + 1}. {name}" for i, (_, name) in enumerate(remaining))
+        try:
+            answer = _ask_resolver_agent(
+                f"What are the official US stock tickers for these companies?\n{listing}",
+                instructions=BATCH_RESOLVER_INSTRUCTIONS
+            )
+        except Exception:
+            answer = None
+        if answer is not None:
+            answers = {}
+            for line in answer.splitlines():
+                number, sep, value = line.partition(":")
+                number = number.strip().lstrip("-* ").rstrip(".")
+                if sep and number.isdigit():
+                    answers[int(number)] = _parse_ticker(value)
+            for i, (key, _) in enumerate(remaining):
+                if i + 1 in answers:
+                    resolved[key] = answers[i + 1]
+
+    if resolved:
+        ticker_cache.store_many(resolved)
+    known.update(resolved)
+    return {name: known.get(key) for name, key in keys.items()}
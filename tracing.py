@@ -0,0 +1,261 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import CACHE_DIR
+
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", os.path.join(CACHE_DIR, "traces.jsonl"))
+# The trace log rolls over to traces.jsonl.1 ... .N once it reaches this size
+TRACE_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", 50 * 1024 * 1024))
+TRACE_LOG_BACKUPS = int(os.getenv("TRACE_LOG_BACKUPS", 3))
+METRICS_PATH = os.getenv("METRICS_PATH", os.path.join(CACHE_DIR, "metrics.prom"))
+METRIC_PREFIX = "duediligence"
+
+# Span attributes that are exported as Prometheus counters
+TOKEN_ATTRS = ("prompt_tokens", "completion_tokens")
+BYTE_ATTRS = ("bytes_sent", "bytes_received")
+
+logger = logging.getLogger("duediligence.trace")
+_current = contextvars.ContextVar("duediligence_span", default=None)
+_log_lock = threading.Lock()
+_log_configured = False
+
+
+class Span:
+    # One timed step. Spans started while another is current become its
+    # children; a span without a parent is the root of a trace.
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attrs = dict(attrs)
+        self.children = []
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._t0 = time.perf_counter()
+
+    def add(self, **values):
+        # Numbers accumulate (tokens and bytes over several calls or retries),
+        # anything else is overwritten.
+        for key, value in values.items():
+            current = self.attrs.get(key)
+            if _is_number(value) and _is_number(current):
+                self.attrs[key] = current + value
+            else:
+                self.attrs[key] = value
+
+    def walk(self, depth=0):
+        yield self, depth
+        for child in list(self.children):
+            yield from child.walk(depth + 1)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attrs": self.attrs,
+        }
+
+    def totals(self):
+        # Token and byte totals over the whole subtree.
+        totals = dict.fromkeys(TOKEN_ATTRS + BYTE_ATTRS, 0)
+        for span, _ in self.walk():
+            for key in totals:
+                if _is_number(span.attrs.get(key)):
+                    totals[key] += span.attrs[key]
+        return totals
+
+    def waterfall(self):
+        # Rows for a waterfall view: offsets are seconds from the root start.
+        rows = []
+        for span, depth in self.walk():
+            rows.append({
+                "span": span.name,
+                "depth": depth,
+                "offset": round(span.start - self.start, 3),
+                "duration": round(span.duration, 3) if span.duration is not None else None,
+                "error": span.error,
+                **span.attrs,
+            })
+        return rows
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Metrics:
+    # Process-wide aggregates of finished spans, rendered in the Prometheus
+    # text exposition format.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+
+    def observe(self, span):
+        with self._lock:
+            stats = self._spans.setdefault(span.name, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += span.duration or 0.0
+            if span.error:
+                stats[2] += 1
+            for key in TOKEN_ATTRS:
+                if _is_number(span.attrs.get(key)):
+                    label = ("tokens_total", span.name, "type", key.split("_")[0])
+                    self._counters[label] = self._counters.get(label, 0) + span.attrs[key]
+            for key in BYTE_ATTRS:
+                if _is_number(span.attrs.get(key)):
+                    label = ("payload_bytes_total", span.name, "direction", key.split("_")[1])
+                    self._counters[label] = self._counters.get(label, 0) + span.attrs[key]
+
+    def record(self, name, seconds):
+        # Timings measured outside a span, e.g. Streamlit script runs.
+        with self._lock:
+            stats = self._spans.setdefault(name, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += seconds
+
+    def to_prometheus(self):
+        with self._lock:
+            spans = {name: list(stats) for name, stats in self._spans.items()}
+            counters = dict(self._counters)
+        lines = [
+            f"# HELP {METRIC_PREFIX}_span_seconds Time spent in report pipeline spans and UI script runs.",
+            f"# TYPE {METRIC_PREFIX}_span_seconds summary",
+        ]
+        for name, (count, total, _) in sorted(spans.items()):
+            lines.append(f'{METRIC_PREFIX}_span_seconds_count{{span="{name}"}} {count}')
+            lines.append(f'{METRIC_PREFIX}_span_seconds_sum{{span="{name}"}} {total:.6f}')
+        lines += [
+            f"# HELP {METRIC_PREFIX}_span_errors_total Spans that ended with an exception.",
+            f"# TYPE {METRIC_PREFIX}_span_errors_total counter",
+        ]
+        for name, (_, _, errors) in sorted(spans.items()):
+            lines.append(f'{METRIC_PREFIX}_span_errors_total{{span="{name}"}} {errors}')
+        for metric, help_text in (
+            ("tokens_total", "Agent tokens used."),
+            ("payload_bytes_total", "Bytes sent to and received from external services."),
+        ):
+            lines += [f"# HELP {METRIC_PREFIX}_{metric} {help_text}", f"# TYPE {METRIC_PREFIX}_{metric} counter"]
+            for (m, name, label, value), total in sorted(counters.items()):
+                if m == metric:
+                    lines.append(f'{METRIC_PREFIX}_{metric}{{span="{name}",{label}="{value}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=METRICS_PATH):
+        # Atomic replace so a textfile collector never reads a partial file.
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+metrics = Metrics()
+
+
+def _configure_logging():
+    global _log_configured
+    with _log_lock:
+        if _log_configured:
+            return
+        _log_configured = True
+        logger.setLevel(logging.INFO)
+        if TRACE_LOG_PATH:
+            try:
+                os.makedirs(os.path.dirname(TRACE_LOG_PATH) or ".", exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    TRACE_LOG_PATH, maxBytes=TRACE_LOG_MAX_BYTES, backupCount=TRACE_LOG_BACKUPS, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            except OSError:
+                pass
+
+
+def _export(root):
+    # One JSON log line per span once the whole trace has finished.
+    _configure_logging()
+    for span, _ in root.walk():
+        logger.info(json.dumps(span.to_dict(), default=str))
+    metrics.write(METRICS_PATH)
+
+
+def current_span():
+    return _current.get()
+
+
+def start_span(name, **attrs):
+    # Starts a child of the current span without making it current; for
+    # generators, which must not leave a span current between yields.
+    parent = _current.get()
+    span = Span(name, parent, **attrs)
+    if parent is not None:
+        parent.children.append(span)
+    return span
+
+
+def end_span(span, error=None):
+    span.duration = time.perf_counter() - span._t0
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    metrics.observe(span)
+    if span.parent is None:
+        _export(span)
+
+
+@contextmanager
+def span(name, **attrs):
+    current = start_span(name, **attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        _current.reset(token)
+        end_span(current, e)
+        raise
+    _current.reset(token)
+    end_span(current)
+
+
+def add(**values):
+    # Records attributes (tokens, payload sizes, ...) on the current span.
+    current = _current.get()
+    if current is not None:
+        current.add(**values)
+
+
+def add_usage(run):
+    # Token usage reported on a finished agent run, if any.
+    usage = getattr(run, "usage", None)
+    if usage is not None:
+        add(prompt_tokens=usage.prompt_tokens or 0, completion_tokens=usage.completion_tokens or 0)
+
+
+def text_bytes(*texts):
+    return sum(len(t.encode("utf-8")) for t in texts if t)
+
+
+def file_bytes(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
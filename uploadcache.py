@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import os
+import time
+
+import downsample
+from config import CACHE_DIR
+from jsoncache import JsonCache
+
+UPLOAD_CACHE_PATH = os.path.join(CACHE_DIR, "uploads.json")
+UPLOAD_TTL = float(os.getenv("UPLOAD_TTL", 24 * 3600))
+UPLOAD_CLEANUP_INTERVAL = float(os.getenv("UPLOAD_CLEANUP_INTERVAL", 600))
+# "full" uploads the CSV as written, "compact" keeps only the columns and rows
+# the agents need, "gzip" additionally compresses the upload.
+UPLOAD_PAYLOAD = os.getenv("UPLOAD_PAYLOAD", "full").lower()
+COMPACT_COLUMNS = ("Close", "Volume")
+COMPACT_MAX_ROWS = int(os.getenv("COMPACT_MAX_ROWS", 760))
+# Longer full payloads (multi-year intraday ranges) are resampled to coarser bars
+UPLOAD_MAX_ROWS = int(os.getenv("UPLOAD_MAX_ROWS", 5000))
+
+
+def compact_frame(data, max_rows=COMPACT_MAX_ROWS):
+    # Close and volume only; ranges longer than max_rows bars are resampled
+    # to the finest coarser bars that fit (weekly for multi-year daily data).
+    frame = downsample.ohlc_downsample(data[[c for c in COMPACT_COLUMNS if c in data.columns]], max_rows)
+    if "Volume" in frame.columns:
+        frame = frame.assign(Volume=frame["Volume"].fillna(0).astype("int64"))
+    return frame
+
+
+def write_payload_csv(data, csv_filename, mode=UPLOAD_PAYLOAD):
+    # Writes the CSV the agents work from in the configured payload mode and
+    # returns the number of rows written.
+    if mode in ("compact", "gzip"):
+        frame = compact_frame(data)
+        frame.to_csv(csv_filename, float_format="%.4f")
+    else:
+        frame = downsample.ohlc_downsample(data, UPLOAD_MAX_ROWS)
+        frame.to_csv(csv_filename)
+    return len(frame)
+
+
+def read_payload(csv_filename, mode=UPLOAD_PAYLOAD):
+    # Returns (content, upload filename). gzip output is deterministic so the
+    # same CSV always hashes to the same key.
+    with open(csv_filename, "rb") as f:
+        content = f.read()
+    filename = os.path.basename(csv_filename)
+    if mode == "gzip":
+        return gzip.compress(content, mtime=0), filename + ".gz"
+    return content, filename
+
+
+def content_key(content, project=""):
+    # File ids only exist in the project they were uploaded to.
+    return hashlib.sha256(project.encode("utf-8") + b"\0" + content).hexdigest()
+
+
+class UploadCache(JsonCache):
+    # Maps payload content hashes (per project) to remote file ids so
+    # identical uploads are reused across pipeline stages, sessions and
+    # repeat reports. Entries expire once unused for ttl; their remote files
+    # are deleted by cleanup().
+    def __init__(self, path=UPLOAD_CACHE_PATH, ttl=UPLOAD_TTL, cleanup_interval=UPLOAD_CLEANUP_INTERVAL):
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._stale = []
+        self._last_cleanup = 0.0
+        super().__init__(path)
+
+    def lookup(self, key):
+        # Last use is tracked in memory and written with the next change.
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.time()
+            if entry is None or now - entry["ts"] > self.ttl:
+                return None
+            entry["ts"] = now
+            return entry["file_id"]
+
+    def store(self, key, file_id, filename):
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous and previous["file_id"] != file_id:
+                self._stale.append(previous["file_id"])
+            self._entries[key] = {"file_id": file_id, "filename": filename, "ts": time.time()}
+            self._save()
+
+    def invalidate(self, file_id):
+        # Drops the entries for a remote file the service no longer accepts.
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if e["file_id"] == file_id]
+            for key in keys:
+                del self._entries[key]
+            if keys:
+                self._save()
+        return bool(keys)
+
+    def get_or_upload(self, content, filename, uploader, project=""):
+        # Returns (file_id, reused). Concurrent uploads of the same content
+        # share a single uploader(content, filename) call.
+        key = content_key(content, project)
+        file_id = self.lookup(key)
+        if file_id:
+            return file_id, True
+
+        def upload():
+            file_id = uploader(content, filename)
+            self.store(key, file_id, filename)
+            return file_id
+
+        file_id, uploaded = self._coalesce(key, upload)
+        return file_id, not uploaded
+
+    def cleanup(self, delete, force=False):
+        # Deletes remote files whose entries have expired, at most once per
+        # cleanup_interval unless forced. Entries are dropped even if the
+        # remote delete fails (the file may already be gone).
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_cleanup < self.cleanup_interval:
+                return []
+            self._last_cleanup = now
+            expired = [k for k, e in self._entries.items() if now - e["ts"] > self.ttl]
+            file_ids = [self._entries.pop(k)["file_id"] for k in expired] + self._stale
+            self._stale = []
+            if expired:
+                self._save()
+        for file_id in file_ids:
+            try:
+                delete(file_id)
+            except Exception:
+                pass
+        return file_ids
+
+
+upload_cache = UploadCache()